@@ -0,0 +1,213 @@
+import logging
+import multiprocessing
+import threading
+import requests
+from time import sleep, time
+from openrefine_wrench.openrefine_api_calls import get_client
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_TIMEOUT = 5
+MAX_FAILURES = 3
+RETRY_AFTER = 60
+
+# seconds between the placement attempts of a project waiting for memory
+PLACE_POLL = 0.1
+
+def parse_backend(backend, default_port="3333"):
+    """split a "host[:port]" backend string into host and port"""
+    host, _, port = backend.strip().rpartition(":")
+    if not host:
+        return port, str(default_port)
+
+    return host, port
+
+def read_backends_file(backends_file, default_port="3333"):
+    """one "host[:port]" backend per line, empty lines and comments
+    starting with # are ignored"""
+    backends = []
+    with(open(file=backends_file, mode="r", encoding="UTF-8")) as fi:
+        for line in fi:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                backends.append(parse_backend(line, default_port))
+
+    return backends
+
+def check_health(host, port):
+    """openrefine backend is healthy if it hands out a csrf token"""
+    try:
+        resp = get_client(host, port).get(
+            "get-csrf-token", timeout=HEALTH_CHECK_TIMEOUT)
+        return resp.status_code == 200 and "token" in resp.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return False
+
+class BackendPool:
+    """Load aware placement of projects on several openrefine backends.
+
+    New projects go to the healthy backend with the least estimated memory
+    of its projects in flight, or the fewest projects in flight. With a
+    memory budget a project only goes to a backend whose projects in
+    flight leave room for it within the budget, a project larger than the
+    budget only to a backend without projects. A backend is taken out of
+    service after max_failures consecutive failed requests and health
+    checked again after retry_after seconds before it gets new work.
+
+    With shared=True the bookkeeping is kept in a manager process, so that
+    the same pool can be used from several worker processes.
+
+    Args:
+        backends:       list of (host, port) tuples
+        shared:         share the pool between processes
+        max_failures:   consecutive failures until a backend is taken out
+        retry_after:    seconds until a failed backend is checked again
+        memory_budget:  optional max estimated memory of the projects in
+                        flight per backend
+    """
+
+    def __init__(
+        self,
+        backends,
+        shared=False,
+        max_failures=MAX_FAILURES,
+        retry_after=RETRY_AFTER,
+        memory_budget=None):
+        self.backends = [(host, str(port)) for host, port in backends]
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.memory_budget = memory_budget
+
+        self._manager = None
+        if shared:
+            self._manager = multiprocessing.Manager()
+            self._lock = self._manager.Lock()
+            self._state = self._manager.dict()
+        else:
+            self._lock = threading.Lock()
+            self._state = {}
+
+        for backend in self.backends:
+            self._state[backend] = {
+                "in_flight": 0,
+                "memory": 0,
+                "failures": 0,
+                "down_until": None}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_manager"] = None
+        return state
+
+    def _update(self, backend, **kwargs):
+        # manager dicts don't track changes of nested values
+        state = self._state[backend]
+        state.update(kwargs)
+        self._state[backend] = state
+        return state
+
+    def check_all(self):
+        """health check all backends, unhealthy ones are taken out"""
+        for backend in self.backends:
+            if check_health(*backend):
+                with self._lock:
+                    self._update(backend, failures=0, down_until=None)
+            else:
+                self._take_out(backend)
+
+    def _take_out(self, backend):
+        with self._lock:
+            self._update(
+                backend,
+                failures=0,
+                down_until=time() + self.retry_after)
+
+        logger.warning(
+            f"openrefine backend {backend[0]}:{backend[1]} taken out of service "
+            f"for {self.retry_after} seconds")
+
+    def _recheck(self):
+        """bring backends back into service whose retry time is due and
+        which pass the health check"""
+        now = time()
+        due = [
+            backend for backend in self.backends
+            if self._state[backend]["down_until"] is not None
+            and self._state[backend]["down_until"] <= now]
+
+        for backend in due:
+            if check_health(*backend):
+                with self._lock:
+                    self._update(backend, down_until=None)
+                logger.info(f"openrefine backend {backend[0]}:{backend[1]} back in service")
+            else:
+                self._take_out(backend)
+
+    def _has_room(self, backend, memory):
+        state = self._state[backend]
+        return (
+            self.memory_budget is None
+            or state["in_flight"] == 0
+            or state["memory"] + memory <= self.memory_budget)
+
+    def acquire(self, memory=0, wait=True):
+        """place a new project with the estimated memory, returns host and
+        port of the backend. Waits until a backend has room for it, or
+        returns None without wait."""
+        while True:
+            self._recheck()
+
+            with self._lock:
+                candidates = [
+                    backend for backend in self.backends
+                    if self._state[backend]["down_until"] is None]
+
+                if not candidates:
+                    raise RuntimeError("no healthy openrefine backend available")
+
+                candidates = [
+                    backend for backend in candidates if self._has_room(backend, memory)]
+
+                if candidates:
+                    backend = min(
+                        candidates,
+                        key=lambda backend: (
+                            self._state[backend]["memory"], self._state[backend]["in_flight"]))
+                    self._update(
+                        backend,
+                        in_flight=self._state[backend]["in_flight"] + 1,
+                        memory=self._state[backend]["memory"] + memory)
+                    return backend
+
+            if not wait:
+                return None
+            sleep(PLACE_POLL)
+
+    def release(self, host, port, memory=0):
+        """project on the backend is done (deleted or given up)"""
+        backend = (host, str(port))
+        with self._lock:
+            self._update(
+                backend,
+                in_flight=max(0, self._state[backend]["in_flight"] - 1),
+                memory=max(0, self._state[backend]["memory"] - memory))
+
+    def succeeded(self, host, port):
+        backend = (host, str(port))
+        if self._state[backend]["failures"]:
+            with self._lock:
+                self._update(backend, failures=0)
+
+    def failed(self, host, port):
+        backend = (host, str(port))
+        with self._lock:
+            state = self._update(
+                backend, failures=self._state[backend]["failures"] + 1)
+
+        if state["failures"] >= self.max_failures:
+            self._take_out(backend)
+
+    def in_flight(self):
+        return {
+            f"{host}:{port}": self._state[(host, port)]["in_flight"]
+            for host, port in self.backends}
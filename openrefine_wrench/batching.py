@@ -0,0 +1,115 @@
+import csv
+import logging
+import os
+import pathlib
+import tempfile
+from openrefine_wrench.compression import is_archive, strip_compression
+from openrefine_wrench.openrefine_api_calls import FILE_MODE, export_file_path
+
+logger = logging.getLogger(__name__)
+
+# column openrefine adds with the includeFileSources option
+FILE_SOURCE_COLUMN = "File"
+
+def batch_files(source_files, max_files, max_bytes=None):
+    """Group source files into batches, each imported into one project.
+
+    A batch is closed when it holds max_files files, when the next file
+    would exceed max_bytes in total or when the next file shares its name
+    (without compression suffix) with a file of the batch (rows are told
+    apart by file name). Archives are batches of their own, their rows
+    can't be told apart by source file.
+    """
+    batch, batch_bytes, names = [], 0, set()
+
+    for file in source_files:
+        file = str(file)
+        size = os.path.getsize(file)
+        name = strip_compression(file).name
+
+        if is_archive(file):
+            yield [file]
+            continue
+
+        if batch and (
+            len(batch) >= max_files
+            or (max_bytes is not None and batch_bytes + size > max_bytes)
+            or name in names):
+            yield batch
+            batch, batch_bytes, names = [], 0, set()
+
+        batch.append(file)
+        batch_bytes += size
+        names.add(name)
+
+    if batch:
+        yield batch
+
+def _source_name(value):
+    """the file source of a row, compressed files (also those compressed
+    for the upload) by their name without compression suffix"""
+    return strip_compression(pathlib.PurePath(value).name).name
+
+def split_export(batch_export_file, project_files, export_dir, source_dir=None):
+    """Split the csv export of a batch project into one export file per
+    source file, laid out like the exports of single file projects.
+
+    The rows are told apart by the file source column, which is dropped
+    from the per file exports. Rows without file source belong to the
+    file of the row before (e.g. following rows of xml records). Every
+    source file gets an export file, only with the header if it has no rows.
+    Source files below source_dir keep their subdirectory below the export
+    dir.
+
+    Returns:
+        export_files:   list of export file paths
+    """
+    files_by_name = {strip_compression(file).name: file for file in project_files}
+    outputs = {}
+
+    def _writer(name):
+        if name not in outputs:
+            export_file = export_file_path(
+                files_by_name[name], export_dir, source_dir=source_dir)
+            export_path = pathlib.Path(export_file)
+            export_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(
+                dir=str(export_path.parent), prefix=f".{pathlib.Path(export_file).name}.", suffix=".part")
+            os.chmod(temp_file, FILE_MODE)
+            fo = open(fd, mode="w", encoding="UTF-8", newline="")
+            writer = csv.writer(fo, lineterminator="\n")
+            writer.writerow(header)
+            outputs[name] = (fo, writer, temp_file, export_file)
+
+        return outputs[name][1]
+
+    header = None
+    completed = False
+
+    try:
+        with(open(file=batch_export_file, mode="r", encoding="UTF-8", newline="")) as fi:
+            reader = csv.reader(fi)
+            header = next(reader)
+            file_index = header.index(FILE_SOURCE_COLUMN)
+            del header[file_index]
+
+            name = None
+            for row in reader:
+                if row[file_index]:
+                    name = _source_name(row[file_index])
+                del row[file_index]
+                _writer(name).writerow(row)
+
+        for name in files_by_name:
+            _writer(name)
+
+        completed = True
+    finally:
+        for fo, _, temp_file, export_file in outputs.values():
+            fo.close()
+            if completed:
+                os.replace(temp_file, export_file)
+            else:
+                os.remove(temp_file)
+
+    return [export_file for _, _, _, export_file in outputs.values()]
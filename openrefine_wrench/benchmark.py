@@ -0,0 +1,66 @@
+import csv
+import logging
+import pathlib
+import random
+
+logger = logging.getLogger(__name__)
+
+# operations of the benchmark mappings, the stand-in doesn't apply them
+BENCHMARK_MAPPINGS = [
+    {
+        "op": "core/column-rename",
+        "description": "Rename column name to label",
+        "oldColumnName": "name",
+        "newColumnName": "label"},
+    {
+        "op": "core/text-transform",
+        "description": "Text transform on cells in column text using expression value.trim()",
+        "engineConfig": {"facets": [], "mode": "row-based"},
+        "columnName": "text",
+        "expression": "value.trim()",
+        "onError": "keep-original",
+        "repeat": False,
+        "repeatCount": 10}]
+
+def generate_dataset(source_dir, files, rows, seed=0):
+    """Write csv source files of mixed sizes, the row counts are log-normally
+    distributed around rows, so a few files are much larger than most.
+
+    Returns:
+        size:           total size of the source files in bytes
+    """
+    rand = random.Random(seed)
+    source_path = pathlib.Path(source_dir)
+    source_path.mkdir(parents=True, exist_ok=True)
+    size = 0
+
+    for num in range(files):
+        source_file = source_path / f"benchmark_{num:05d}.csv"
+        with(open(file=source_file, mode="w", encoding="UTF-8", newline="")) as fo:
+            writer = csv.writer(fo, lineterminator="\n")
+            writer.writerow(["id", "name", "value", "text"])
+            for row in range(max(1, int(rows * rand.lognormvariate(0, 1)))):
+                writer.writerow([
+                    f"{num}-{row}",
+                    f"name {rand.randrange(10 ** 6)}",
+                    f"{rand.random():.6f}",
+                    " lorem ipsum dolor sit amet " * rand.randint(1, 4)])
+        size += source_file.stat().st_size
+
+    logger.info(f"generated {files} source files with {size} bytes in {source_dir}")
+
+    return size
+
+def format_report(results):
+    """benchmark results as text table"""
+    lines = [
+        f"{'engine':<10}{'workers':>8}{'files':>8}{'failed':>8}"
+        f"{'seconds':>10}{'files/s':>10}{'MB/s':>8}"]
+
+    for result in results:
+        lines.append(
+            f"{result['engine']:<10}{result['max_workers']:>8}{result['files']:>8}"
+            f"{result['failed']:>8}{result['seconds']:>10.2f}"
+            f"{result['files_per_second']:>10.2f}{result['mb_per_second']:>8.2f}")
+
+    return "\n".join(lines)
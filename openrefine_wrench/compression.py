@@ -0,0 +1,59 @@
+import bz2
+import gzip
+import pathlib
+
+# compressed source files, imported by openrefine as they are and read as
+# decompressed streams where openrefine-wrench needs their content
+COMPRESSED_OPENERS = {".gz": gzip.open, ".bz2": bz2.open}
+
+# archives of source files, imported by openrefine as one project
+ARCHIVE_SUFFIXES = (".zip",)
+
+def compression_suffix(source_file):
+    """the compression or archive suffix of a source file, empty if it has
+    none"""
+    suffix = pathlib.PurePath(source_file).suffix.lower()
+    if suffix in COMPRESSED_OPENERS or suffix in ARCHIVE_SUFFIXES:
+        return suffix
+
+    return ""
+
+def is_archive(source_file):
+    return compression_suffix(source_file) in ARCHIVE_SUFFIXES
+
+def strip_compression(source_file):
+    """the path of a source file without its compression suffix"""
+    path = pathlib.PurePath(source_file)
+    if compression_suffix(path) and not is_archive(path):
+        return path.with_suffix("")
+
+    return path
+
+def is_source_file(name, source_format):
+    """the file is a source file of the format, plain or compressed, or an
+    archive (of source files)"""
+    return (
+        str(strip_compression(name)).endswith(f".{source_format}")
+        or is_archive(name))
+
+def open_source(source_file, mode="r", encoding=None, newline=None):
+    """Open a source file, compressed ones as decompressed stream, never
+    decompressed to disk. Archives can't be opened as one stream.
+
+    Args:
+        source_file:    path of the source file
+        mode:           "r" (text) or "rb"
+        encoding:       encoding of text mode
+        newline:        newline handling of text mode
+    """
+    if is_archive(source_file):
+        raise ValueError(f"archive {source_file} can't be read as a single source file")
+
+    opener = COMPRESSED_OPENERS.get(compression_suffix(source_file))
+    if opener is None:
+        return open(source_file, mode=mode, encoding=encoding, newline=newline)
+
+    if "b" in mode:
+        return opener(source_file, mode=mode)
+
+    return opener(source_file, mode="rt", encoding=encoding, newline=newline)
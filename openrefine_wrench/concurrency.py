@@ -0,0 +1,195 @@
+import logging
+import threading
+from openrefine_wrench.metrics import quantile
+
+logger = logging.getLogger(__name__)
+
+# the latency of a job is its stage seconds per source size plus this number
+# of bytes, so the fixed request overhead dominates for small files
+LATENCY_OFFSET_BYTES = 1024 * 1024
+
+# a window median above the baseline times the tolerance counts as overload
+LATENCY_TOLERANCE = 2.0
+
+DECREASE_FACTOR = 0.5
+
+class AdaptiveConcurrency:
+    """Additive increase, multiplicative decrease of the projects in flight.
+
+    Jobs are admitted through gate() as long as fewer than limit projects
+    are in flight, every finished job is reported to done(). The limit
+    starts at min_workers and grows by one after each window of limit jobs
+    finished without errors, as long as the median latency of the window
+    stays within the tolerance of the best window median seen so far. A
+    failed or retried job or an overloaded window halves the limit, errors
+    of jobs in flight at that time don't decrease it again.
+
+    Args:
+        min_workers:    lower bound of the projects in flight
+        max_workers:    upper bound of the projects in flight
+    """
+
+    def __init__(self, min_workers, max_workers):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.limit = self.min_workers
+
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._window = []
+        self._baseline = None
+        self._cooldown = 0
+
+    def gate(self, jobs):
+        """yield the jobs, each as soon as a project may be added"""
+        for job in jobs:
+            with self._condition:
+                self._condition.wait_for(lambda: self._in_flight < self.limit)
+                self._in_flight += 1
+            yield job
+
+    def done(self, seconds, size, failed=False, retried=False):
+        """a job finished after seconds of stage time for size source bytes"""
+        with self._condition:
+            self._in_flight -= 1
+            self._cooldown = max(0, self._cooldown - 1)
+
+            if failed or retried:
+                if not self._cooldown:
+                    self._decrease("failed job" if failed else "retried job")
+            else:
+                self._observe(seconds / (size + LATENCY_OFFSET_BYTES))
+
+            self._condition.notify_all()
+
+    def _observe(self, latency):
+        self._window.append(latency)
+        if len(self._window) < self.limit:
+            return
+
+        median = quantile(self._window, 0.5)
+        self._window = []
+
+        if self._baseline is None or median < self._baseline:
+            self._baseline = median
+
+        if median > self._baseline * LATENCY_TOLERANCE:
+            if not self._cooldown:
+                self._decrease(
+                    f"latency {median / self._baseline:.1f} times the baseline")
+        elif self.limit < self.max_workers:
+            self._change(self.limit + 1, "window without errors")
+
+    def _decrease(self, reason):
+        self._change(max(self.min_workers, int(self.limit * DECREASE_FACTOR)), reason)
+        # jobs started under the old limit don't count against the new one
+        self._cooldown = self._in_flight
+        self._window = []
+
+    def _change(self, limit, reason):
+        if limit != self.limit:
+            logger.info(f"concurrency changed from {self.limit} to {limit} projects in flight ({reason})")
+        self.limit = limit
+
+# projects in openrefine take about this many times the size of their source
+MEMORY_FACTORS = {"csv": 10.0, "xml": 4.0}
+
+# number of jobs looked ahead for one that fits into the memory budget
+LOOKAHEAD = 64
+
+# number of later jobs which may pass a job put aside
+MAX_BYPASSES = 256
+
+# seconds until jobs put aside are tried again without a released job, a
+# server taken out of service may be back
+PLACE_RETRY = 1.0
+
+class MemoryBudget:
+    """Admission of jobs by the estimated memory of their projects.
+
+    Jobs are admitted through gate() as long as the estimates of the
+    projects in flight stay within the budget, every finished job is
+    reported to done(). A job which doesn't fit is put aside and the
+    following ones (up to LOOKAHEAD) are tried, so that small files keep
+    going around large ones. Jobs put aside are admitted first once memory
+    is freed, and once passed by MAX_BYPASSES later jobs no other job is
+    admitted before them. A job larger than the whole budget is admitted
+    when nothing else is in flight.
+
+    With place, the budget holds per server: a job is admitted once place
+    puts it on a server with room for it, place returns False if there is
+    none.
+
+    Args:
+        budget:         estimated memory of the projects in flight in bytes
+        place:          optional function placing a job on one of several
+                        servers
+    """
+
+    def __init__(self, budget, place=None):
+        self.budget = budget
+        self.place = place
+        self.in_use = 0
+
+        self._in_flight = 0
+        self._released = 0
+        self._condition = threading.Condition()
+
+    def gate(self, jobs, estimate):
+        """yield the jobs as they fit into the budget, estimate returns the
+        memory of a job, kept with the job as memory_estimate"""
+        jobs = iter(jobs)
+        waiting = []
+        exhausted = False
+
+        while True:
+            with self._condition:
+                job = self._admit(waiting)
+                if job is None and (exhausted or len(waiting) >= LOOKAHEAD):
+                    if exhausted and not waiting:
+                        return
+                    released = self._released
+                    self._condition.wait_for(
+                        lambda: self._released != released,
+                        timeout=PLACE_RETRY if self.place is not None else None)
+                    continue
+
+            if job is not None:
+                yield job
+                continue
+
+            job = next(jobs, None)
+            if job is None:
+                exhausted = True
+            else:
+                job["memory_estimate"] = estimate(job)
+                waiting.append([job, 0])
+
+    def _admit(self, waiting):
+        for index, (job, bypasses) in enumerate(waiting):
+            if self.place is not None:
+                fits = self.place(job)
+            else:
+                fits = (
+                    self._in_flight == 0
+                    or self.in_use + job["memory_estimate"] <= self.budget)
+            if fits:
+                for entry in waiting[:index]:
+                    entry[1] += 1
+                del waiting[index]
+                self.in_use += job["memory_estimate"]
+                self._in_flight += 1
+                return job
+
+            if bypasses >= MAX_BYPASSES:
+                break
+
+        return None
+
+    def done(self, job):
+        """the project of an admitted job is gone"""
+        with self._condition:
+            self.in_use -= job.get("memory_estimate", 0)
+            self._in_flight -= 1
+            self._released += 1
+            self._condition.notify_all()
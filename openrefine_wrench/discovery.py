@@ -0,0 +1,93 @@
+import fnmatch
+import json
+import logging
+import os
+import pathlib
+
+import click
+from openrefine_wrench.compression import is_source_file
+
+logger = logging.getLogger(__name__)
+
+def discover_files(source_dir, source_format, recursive=False, skip_dirs=()):
+    """Yield the source files of the source dir as they are found.
+
+    Directories are read with os.scandir, entry by entry, so that the first
+    files are yielded right away and memory doesn't grow with the number of
+    entries. Compressed source files and archives are found as well.
+    Subdirectories are walked with recursive, except for hidden
+    ones (e.g. the shard dirs) and the skip_dirs (e.g. the export dir).
+    Symlinked directories are followed, each directory is walked once.
+    """
+    skip_dirs = {str(pathlib.Path(skip_dir).resolve()) for skip_dir in skip_dirs}
+    dirs = [str(source_dir)]
+    visited = set()
+
+    while dirs:
+        current_dir = dirs.pop()
+        stat = os.stat(current_dir)
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+
+        with os.scandir(current_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if (recursive
+                        and not entry.name.startswith(".")
+                        and str(pathlib.Path(entry.path).resolve()) not in skip_dirs):
+                        dirs.append(entry.path)
+                elif is_source_file(entry.name, source_format) and entry.is_file():
+                    yield pathlib.Path(entry.path)
+
+def read_source_list(source_list):
+    """Yield the source files listed one per line as they are read, "-"
+    reads the list from stdin. Lines of a failed files report are json
+    objects with the source file."""
+    with click.open_file(source_list, mode="r", encoding="UTF-8") as fi:
+        for line in fi:
+            line = line.strip()
+            if line.startswith("{"):
+                line = json.loads(line)["source_file"]
+            if line:
+                yield pathlib.Path(line)
+
+def _matches(path, patterns, base_dir=None):
+    names = [path.name, str(path)]
+    if base_dir is not None:
+        try:
+            names.append(str(path.relative_to(base_dir)))
+        except ValueError:
+            pass
+
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns for name in names)
+
+def filter_files(
+    source_files,
+    include=(),
+    exclude=(),
+    min_size=None,
+    max_size=None,
+    base_dir=None):
+    """Yield the source files matching any of the include patterns (if
+    given) and none of the exclude patterns, with a size within min_size
+    and max_size bytes. Patterns are glob patterns matched against the file
+    name, its path and its path relative to base_dir."""
+    filtered = 0
+
+    for file in source_files:
+        path = pathlib.Path(file)
+        if ((include and not _matches(path, include, base_dir))
+            or (exclude and _matches(path, exclude, base_dir))):
+            filtered += 1
+            continue
+        if min_size is not None or max_size is not None:
+            size = path.stat().st_size
+            if ((min_size is not None and size < min_size)
+                or (max_size is not None and size > max_size)):
+                filtered += 1
+                continue
+        yield path
+
+    if filtered:
+        logger.info(f"filtered out {filtered} source files")
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import pathlib
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = ".openrefine-wrench-journal.jsonl"
+
+def _key(file):
+    return str(pathlib.Path(file).resolve())
+
+def source_stats(files):
+    """size and modification time of the source files of a job"""
+    stats = []
+    for file in files:
+        stat = os.stat(file)
+        stats.append([_key(file), stat.st_size, stat.st_mtime])
+
+    return stats
+
+class Journal:
+    """Append only record of the stage transitions of all jobs of a run.
+
+    Every finished stage of a job appends one json line with the job key
+    (its first source file) and the stage name, the create stage also the
+    backend, the project id and the source file stats. Lines are written
+    with a single unbuffered append, which doesn't interleave between the
+    processes and threads of a run, a partially written last line of a
+    killed run is ignored when the journal is loaded.
+
+    Args:
+        export_dir:     openrefine export data dir
+        settings_hash:  hash of the run settings, projects of a previous run
+                        with other settings are not reused
+    """
+
+    def __init__(self, export_dir, settings_hash):
+        self.path = pathlib.Path(export_dir) / JOURNAL_FILE
+        self.settings_hash = settings_hash
+        self.unfinished = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["unfinished"] = {}
+        return state
+
+    def load(self):
+        """Read the journal of a previous run.
+
+        Returns:
+            unfinished:     key to merged stage records of all jobs whose
+                            project wasn't deleted
+        """
+        jobs = {}
+        settings_hash = None
+
+        if self.path.exists():
+            with(open(file=self.path, mode="r", encoding="UTF-8")) as fi:
+                for line in fi:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "settings_hash" in record:
+                        settings_hash = record["settings_hash"]
+                    else:
+                        jobs.setdefault(record["key"], {}).update(record)
+
+        self.unfinished = {
+            key: job for key, job in jobs.items()
+            if job["stage"] != "delete"}
+
+        for job in self.unfinished.values():
+            job["same_settings"] = settings_hash == self.settings_hash
+
+        return self.unfinished
+
+    def start(self, carried=()):
+        """Begin the journal of this run, replacing the previous one. The
+        records of carried jobs (not yet finished from the previous run) are
+        kept, the file is swapped atomically."""
+        fd, temp_file = tempfile.mkstemp(
+            dir=str(self.path.parent), prefix=f"{self.path.name}.", suffix=".part")
+        try:
+            with open(fd, mode="w", encoding="UTF-8") as fo:
+                fo.write(json.dumps({"settings_hash": self.settings_hash}) + "\n")
+                for job in carried:
+                    fo.write(json.dumps(
+                        {key: value for key, value in job.items() if key != "same_settings"})
+                        + "\n")
+                fo.flush()
+                os.fsync(fo.fileno())
+            os.replace(temp_file, str(self.path))
+        except BaseException:
+            os.remove(temp_file)
+            raise
+
+    def record(self, project_file, stage, **fields):
+        """append the finished stage of the job of project_file"""
+        line = json.dumps(dict(fields, key=_key(project_file), stage=stage)) + "\n"
+
+        fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("UTF-8"))
+        finally:
+            os.close(fd)
+
+    def unchanged(self, job):
+        """the source files of an unfinished job are unchanged since its
+        project was created"""
+        try:
+            return job.get("sources") == source_stats(
+                [source[0] for source in job.get("sources", [])])
+        except OSError:
+            return False
+
+    def take(self, project_file, files):
+        """Hand over the unfinished job of project_file to this run, if its
+        project is applied, the run settings are the same and its source
+        files are unchanged.
+
+        Returns:
+            job:            merged stage records of the job or None
+        """
+        job = self.unfinished.get(_key(project_file))
+
+        if (job is None
+            or job["stage"] != "apply"
+            or not job["same_settings"]
+            or [source[0] for source in job.get("sources", [])] != [_key(file) for file in files]
+            or not self.unchanged(job)):
+            return None
+
+        return self.unfinished.pop(_key(project_file))
+
+    def remove(self):
+        """the run is complete, nothing left to resume"""
+        if self.path.exists():
+            os.remove(str(self.path))
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = ".openrefine-wrench-manifest.json"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# the manifest is saved after this number of recorded files or seconds
+SAVE_EVERY_FILES = 100
+SAVE_EVERY_SECONDS = 10
+
+def file_hash(path):
+    """sha256 hex digest of the file content"""
+    digest = hashlib.sha256()
+    with(open(file=path, mode="rb")) as fi:
+        for chunk in iter(lambda: fi.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def settings_hash(settings):
+    """sha256 hex digest of json serializable settings"""
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True).encode("UTF-8")).hexdigest()
+
+class Manifest:
+    """Record of the processed source files in the export dir.
+
+    Each source file is recorded with the hash of its content, of the
+    mappings file and of the import options it was processed with, as well
+    as the path of its export. Source files are unchanged, if all of them
+    still match and the export file still exists (at the path given by
+    export_path, if set). Hashing of the content is
+    skipped for files with the recorded size and modification time. The
+    recorded processing durations serve as cost estimates for later runs.
+
+    Args:
+        export_dir:     openrefine export data dir
+        mappings_hash:  hash of the mappings file
+        options_hash:   hash of the import options
+        hashes:         optional function of a source file returning its
+                        mappings and options hash, if they differ by file
+        export_path:    optional function of a source file returning the
+                        path of its export file
+    """
+
+    def __init__(self, export_dir, mappings_hash, options_hash, hashes=None, export_path=None):
+        self.path = pathlib.Path(export_dir) / MANIFEST_FILE
+        self.mappings_hash = mappings_hash
+        self.options_hash = options_hash
+        self.hashes = hashes or (lambda source_file: (self.mappings_hash, self.options_hash))
+        self.export_path = export_path
+        self.entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = monotonic()
+        self._rate = None
+
+        if self.path.exists():
+            with(open(file=self.path, mode="r", encoding="UTF-8")) as fi:
+                self.entries = json.load(fi).get("files", {})
+
+    @staticmethod
+    def _key(source_file):
+        return str(pathlib.Path(source_file).resolve())
+
+    def is_unchanged(self, source_file):
+        """check the source file against the manifest, the state of changed
+        files is kept to be recorded once they are processed"""
+        key = self._key(source_file)
+        stat = os.stat(source_file)
+        entry = self.entries.get(key)
+
+        if (entry is not None
+            and [entry["mappings_hash"], entry["options_hash"]] == list(self.hashes(source_file))
+            and os.path.exists(entry["export_file"])
+            and (self.export_path is None
+                 or pathlib.Path(self.export_path(source_file)).resolve()
+                 == pathlib.Path(entry["export_file"]))):
+            if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                return True
+
+            content_hash = file_hash(source_file)
+            if entry["content_hash"] == content_hash:
+                with self._lock:
+                    entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                return True
+        else:
+            content_hash = None
+
+        with self._lock:
+            self._pending[key] = (content_hash, stat)
+
+        return False
+
+    def changed_files(self, source_files, force=False):
+        """yield the source files which have to be processed"""
+        skipped = 0
+        for source_file in source_files:
+            if not force and self.is_unchanged(source_file):
+                skipped += 1
+                continue
+            if force:
+                with self._lock:
+                    self._pending[self._key(source_file)] = (None, os.stat(source_file))
+            yield source_file
+
+        if skipped:
+            logger.info(f"skipped {skipped} unchanged source files")
+
+    def estimate(self, source_file):
+        """Estimated processing cost of a source file, its last recorded
+        duration or its size at the mean rate of all recorded durations.
+
+        Returns:
+            cost:           seconds, the size in bytes if no durations are
+                            recorded yet
+        """
+        size = os.path.getsize(source_file)
+
+        if self._rate is None:
+            timed = [entry for entry in self.entries.values() if entry.get("seconds")]
+            self._rate = (
+                sum(entry["seconds"] for entry in timed)
+                / max(1, sum(entry["size"] for entry in timed))) if timed else 0
+
+        if not self._rate:
+            return size
+
+        entry = self.entries.get(self._key(source_file))
+        if entry is not None and entry.get("seconds"):
+            return entry["seconds"]
+
+        return size * self._rate
+
+    def record(self, source_file, export_file, seconds=None, content_hash=None):
+        """record a processed source file, its export and the seconds it
+        took to process, the content hash is computed unless it is known
+        already or passed (e.g. hashed by the worker)"""
+        key = self._key(source_file)
+
+        with self._lock:
+            pending_hash, stat = self._pending.pop(key, (None, None))
+
+        if stat is None:
+            stat = os.stat(source_file)
+        content_hash = pending_hash or content_hash
+        if content_hash is None:
+            content_hash = file_hash(source_file)
+
+        mappings_hash, options_hash = self.hashes(source_file)
+
+        with self._lock:
+            self.entries[key] = {
+                "content_hash": content_hash,
+                "mappings_hash": mappings_hash,
+                "options_hash": options_hash,
+                "export_file": str(pathlib.Path(export_file).resolve()),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "seconds": seconds}
+            self._unsaved += 1
+
+            if (self._unsaved >= SAVE_EVERY_FILES
+                or monotonic() - self._saved_at >= SAVE_EVERY_SECONDS):
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        fd, temp_file = tempfile.mkstemp(
+            dir=str(self.path.parent), prefix=f"{self.path.name}.", suffix=".part")
+        try:
+            with open(fd, mode="w", encoding="UTF-8") as fo:
+                json.dump({"files": self.entries}, fo, indent=1, sort_keys=True)
+            os.replace(temp_file, str(self.path))
+        except BaseException:
+            os.remove(temp_file)
+            raise
+
+        self._unsaved = 0
+        self._saved_at = monotonic()
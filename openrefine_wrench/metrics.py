@@ -0,0 +1,166 @@
+import json
+import logging
+import math
+import os
+import pathlib
+import tempfile
+from time import monotonic, time
+
+logger = logging.getLogger(__name__)
+
+# summary quantiles of the stage durations
+QUANTILES = (0.5, 0.95)
+
+def quantile(values, q):
+    """nearest rank quantile of the values, None if there are none"""
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+class RunMetrics:
+    """Per job metrics of a run.
+
+    Each job is added as one record with the seconds of its stages (and of
+    the async processes of its apply), the bytes sent and received and its
+    status. Records are appended to the metrics file as json lines when
+    given, the stage durations are kept for the summary at the end of the
+    run. The shards of a sharded file count as one file, failed if any of
+    them failed.
+
+    Args:
+        metrics_file:   optional json lines file of the job records
+    """
+
+    def __init__(self, metrics_file=None):
+        self.started = monotonic()
+        self.stage_seconds = {}
+        self.files = {"ok": 0, "failed": 0}
+        self.bytes = {"sent": 0, "received": 0}
+        self._sharded = {}
+        self._fo = None
+
+        if metrics_file is not None:
+            self._fo = open(metrics_file, mode="w", encoding="UTF-8")
+
+    def add(self, record):
+        """add the record of a finished job"""
+        for stage, seconds in record["stages"].items():
+            self.stage_seconds.setdefault(stage, []).append(seconds)
+
+        if "shard_of" in record:
+            self._add_shard(record["shard_of"], record["status"])
+        else:
+            self.files[record["status"]] += len(record["source_files"])
+        self.bytes["sent"] += record["bytes_sent"]
+        self.bytes["received"] += record["bytes_received"]
+
+        if self._fo is not None:
+            self._fo.write(json.dumps(record) + "\n")
+            self._fo.flush()
+
+    def _add_shard(self, source_file, status):
+        counted = self._sharded.get(source_file)
+        if counted == "failed" or counted == status:
+            return
+
+        if counted is not None:
+            self.files[counted] -= 1
+        self.files[status] += 1
+        self._sharded[source_file] = status
+
+    def close(self):
+        if self._fo is not None:
+            self._fo.close()
+            self._fo = None
+
+    def summary(self):
+        """Summary of the run so far.
+
+        Returns:
+            summary:        dict of files, bytes, seconds, files per second,
+                            mb per second (sent and received) and per stage
+                            quantiles and max of the durations
+        """
+        seconds = monotonic() - self.started
+        files = sum(self.files.values())
+
+        return {
+            "files": dict(self.files),
+            "bytes": dict(self.bytes),
+            "seconds": seconds,
+            "files_per_second": files / seconds if seconds else 0.0,
+            "mb_per_second": sum(self.bytes.values()) / 1e6 / seconds if seconds else 0.0,
+            "stages": {
+                stage: dict(
+                    {f"p{int(q * 100)}": quantile(values, q) for q in QUANTILES},
+                    max=max(values),
+                    count=len(values))
+                for stage, values in self.stage_seconds.items()}}
+
+    def log_summary(self):
+        summary = self.summary()
+
+        logger.info(
+            f"processed {summary['files']['ok']} files ({summary['files']['failed']} failed) "
+            f"in {summary['seconds']:.1f} seconds, {summary['files_per_second']:.2f} files/s, "
+            f"{summary['mb_per_second']:.2f} MB/s")
+
+        for stage, stats in summary["stages"].items():
+            logger.info(
+                f"{stage} stage: "
+                + ", ".join(f"{key} {value:.3f}s" for key, value in stats.items() if key != "count")
+                + f" ({stats['count']} jobs)")
+
+    def write_prometheus(self, textfile):
+        """Write the metrics of the run for the textfile collector of the
+        prometheus node exporter, swapped atomically as the collector
+        requires."""
+        summary = self.summary()
+        lines = [
+            "# HELP openrefine_wrench_stage_seconds Seconds per job and stage.",
+            "# TYPE openrefine_wrench_stage_seconds summary"]
+
+        for stage, values in self.stage_seconds.items():
+            for q in QUANTILES:
+                lines.append(
+                    f"openrefine_wrench_stage_seconds{{stage=\"{stage}\",quantile=\"{q}\"}} "
+                    f"{quantile(values, q)}")
+            lines.append(f"openrefine_wrench_stage_seconds_sum{{stage=\"{stage}\"}} {sum(values)}")
+            lines.append(f"openrefine_wrench_stage_seconds_count{{stage=\"{stage}\"}} {len(values)}")
+
+        lines.extend([
+            "# HELP openrefine_wrench_files Source files processed by the last run.",
+            "# TYPE openrefine_wrench_files gauge"])
+        lines.extend(
+            f"openrefine_wrench_files{{status=\"{status}\"}} {count}"
+            for status, count in summary["files"].items())
+
+        lines.extend([
+            "# HELP openrefine_wrench_bytes Bytes sent to and received from openrefine by the last run.",
+            "# TYPE openrefine_wrench_bytes gauge"])
+        lines.extend(
+            f"openrefine_wrench_bytes{{direction=\"{direction}\"}} {count}"
+            for direction, count in summary["bytes"].items())
+
+        lines.extend([
+            "# HELP openrefine_wrench_run_seconds Duration of the last run.",
+            "# TYPE openrefine_wrench_run_seconds gauge",
+            f"openrefine_wrench_run_seconds {summary['seconds']}",
+            "# HELP openrefine_wrench_last_run_timestamp_seconds End time of the last run.",
+            "# TYPE openrefine_wrench_last_run_timestamp_seconds gauge",
+            f"openrefine_wrench_last_run_timestamp_seconds {time()}"])
+
+        textfile_path = pathlib.Path(textfile)
+        fd, temp_file = tempfile.mkstemp(
+            dir=str(textfile_path.parent), prefix=f".{textfile_path.name}.", suffix=".part")
+        try:
+            with open(fd, mode="w", encoding="UTF-8") as fo:
+                fo.write("\n".join(lines) + "\n")
+            os.chmod(temp_file, 0o644)
+            os.replace(temp_file, str(textfile_path))
+        except BaseException:
+            os.remove(temp_file)
+            raise
@@ -1,31 +1,419 @@
+import codecs
+import hashlib
+import os
 import pathlib
 import logging
+import random
+import tempfile
+import threading
+import uuid
+import zlib
 import requests
 import json
-from time import sleep
+from time import sleep, monotonic
 from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from openrefine_wrench.compression import compression_suffix, strip_compression
 
 logger = logging.getLogger(__name__)
 
-def _get_csrf_token(host, port, pid):
-    """required for all post requests against the openrefine api"""
-    resp_csrf_token = None
+DEFAULT_POOL_MAXSIZE = 4
+
+# seconds to connect and seconds to wait for data of each request, a
+# timed out request counts as transient error
+DEFAULT_REQUEST_TIMEOUT = (10.0, 900.0)
+
+ASYNC_POLL_MIN = 0.05
+ASYNC_POLL_MAX = 5.0
+
+EXPORT_CHUNK_SIZE = 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_COMPRESS_LEVEL = 6
+
+# export file suffixes of the openrefine export formats
+EXPORT_SUFFIXES = {
+    "csv": ".csv",
+    "tsv": ".tsv",
+    "xls": ".xls",
+    "xlsx": ".xlsx",
+    "ods": ".ods",
+    "html": ".html",
+    "template": ".json"}
+
+def _file_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+# mode of files created by open() under the umask, given to the temporary
+# files (created with mode 0600) before they are renamed to export files
+FILE_MODE = _file_mode()
+
+_local = threading.local()
+
+_pool_maxsize = DEFAULT_POOL_MAXSIZE
+
+_request_timeout = DEFAULT_REQUEST_TIMEOUT
+
+class OpenRefineClient:
+    """Keep-alive http session against a single openrefine host.
+
+    All api calls of a worker (process or thread) are routed through one
+    instance, so that tcp connections are pooled and reused instead of
+    being opened and torn down for each request. The csrf token required
+    for post requests is cached and only refreshed if openrefine rejects it.
+
+    Args:
+        host:           base url of the used openrefine host
+        port:           openrefine port
+        pool_maxsize:   number of pooled connections kept alive
+        timeout:        (connect, read) timeout in seconds of the requests
+                        without a timeout of their own
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.base_url = f"http://{host}:{port}/command/core"
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+
+        self._csrf_token = None
+
+    def get(self, command, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        resp = self.session.get(f"{self.base_url}/{command}", **kwargs)
+        resp.raise_for_status()
+
+        return resp
+
+    def post(self, command, **kwargs):
+        """post request with the cached csrf token, on rejection the token
+        is refreshed and the request is retried once"""
+        params = dict(kwargs.pop("params", None) or {})
+        params["csrf_token"] = self.csrf_token()
+        kwargs.setdefault("timeout", self.timeout)
+
+        resp = self.session.post(
+            f"{self.base_url}/{command}", params=params, **kwargs)
+
+        if _is_csrf_error(resp):
+            logger.info(f"csrf token rejected by {self.host}:{self.port}, refresh token")
+            _rewind_body(kwargs)
+            params["csrf_token"] = self.csrf_token(refresh=True)
+            resp = self.session.post(
+                f"{self.base_url}/{command}", params=params, **kwargs)
+
+        resp.raise_for_status()
+
+        return resp
+
+    def csrf_token(self, refresh=False):
+        """cached csrf token, fetched on first use or on refresh only"""
+        if self._csrf_token is None or refresh:
+            self._csrf_token = None
+            self._csrf_token = self.get("get-csrf-token").json()["token"]
+
+        return self._csrf_token
+
+    def close(self):
+        self.session.close()
+
+def _is_csrf_error(resp):
+    """openrefine answers a missing or outdated csrf token with a small
+    json error message instead of processing the request"""
+    if not resp.headers.get("Content-Type", "").startswith("application/json"):
+        return False
+
+    if int(resp.headers.get("Content-Length", 0) or 0) > 1024:
+        return False
+
+    try:
+        resp_json = resp.json()
+    except ValueError:
+        return False
+
+    return (
+        isinstance(resp_json, dict)
+        and resp_json.get("code") == "error"
+        and "csrf_token" in str(resp_json.get("message")))
+
+def is_transient_error(exc):
+    """errors worth a retry: connection failures, timeouts, broken
+    responses and server side errors"""
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and exc.response.status_code >= 500
+
+    return isinstance(exc, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError))
+
+def _rewind_body(kwargs):
+    """rewind file like request bodies before a request is retried,
+    iterable bodies like uploads are replayed from the start anyway"""
+    bodies = [kwargs.get("data")]
+    bodies.extend(
+        file[1] if isinstance(file, tuple) else file
+        for file in (kwargs.get("files") or {}).values())
+
+    for body in bodies:
+        if hasattr(body, "seek"):
+            body.seek(0)
+
+def _response_charset(resp, default="UTF-8"):
+    """charset declared in the content type of the response, openrefine
+    writes its exports utf-8 encoded if nothing else is declared"""
+    for param in resp.headers.get("Content-Type", "").split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "charset" and value:
+            return value.strip("\"' ")
+
+    return default
+
+def _stream_to_file(resp, target_file, encoding="UTF-8"):
+    """Write the response body chunkwise to the target file.
+
+    The body is written to a temporary file next to the target file, which
+    is atomically renamed when complete, so the target file is never left
+    half written. The body is only transcoded (incrementally) if the
+    declared charset differs from the wanted encoding.
+
+    Returns:
+        size:           number of bytes read from the response
+    """
+    charset = _response_charset(resp)
+    decoder = None
+    if codecs.lookup(charset).name != codecs.lookup(encoding).name:
+        decoder = codecs.getincrementaldecoder(charset)()
+
+    target_path = pathlib.Path(target_file)
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    size = 0
+
+    fd, temp_file = tempfile.mkstemp(
+        dir=str(target_path.parent), prefix=f".{target_path.name}.", suffix=".part")
+    try:
+        os.chmod(temp_file, FILE_MODE)
+        with open(fd, mode="wb") as fo:
+            for chunk in resp.iter_content(chunk_size=EXPORT_CHUNK_SIZE):
+                size += len(chunk)
+                if decoder is not None:
+                    chunk = decoder.decode(chunk).encode(encoding)
+                fo.write(chunk)
+            if decoder is not None:
+                fo.write(decoder.decode(b"", final=True).encode(encoding))
+        os.replace(temp_file, str(target_path))
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    finally:
+        resp.close()
+
+    return size
+
+class _MultipartUpload:
+    """Streamed multipart/form-data request body for project uploads.
+
+    The form fields are sent first, followed by the project files, read in
+    chunks of bounded size and gzip compressed on the fly if requested
+    (unless they are compressed already). The
+    files are opened anew for every iteration and closed when done, so the
+    body can be replayed if the request has to be retried. The bytes sent
+    by the last iteration are counted in sent, the sha256 hex digests of
+    the files read completely are kept in hashes by path.
+
+    Args:
+        fields:         form fields as dict
+        file_field:     name of the file form field
+        project_files:  list of (path, file name sent to openrefine) tuples
+        compress:       gzip the files on the fly
+    """
+
+    def __init__(self, fields, file_field, project_files, compress=False):
+        self.project_files = project_files
+        self.compress = compress
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        self._head = "".join(
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+            f"{value}\r\n" for name, value in fields.items()).encode("UTF-8")
+
+        self._compressed = [
+            compress and not compression_suffix(path) for path, _ in project_files]
+
+        self._file_heads = []
+        for (_, filename), compressed in zip(project_files, self._compressed):
+            if compressed:
+                filename = f"{filename}.gz"
+            self._file_heads.append((
+                f"--{self.boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{file_field}\"; "
+                f"filename=\"{_quote_filename(filename)}\"\r\n"
+                f"Content-Type: application/octet-stream\r\n\r\n").encode("UTF-8"))
+
+        self._tail = f"--{self.boundary}--\r\n".encode("UTF-8")
+
+        self.sent = 0
+        self.hashes = {}
+
+        # picked up by requests as content length, without it (compressed
+        # uploads) the body is sent with chunked transfer encoding
+        self.len = None
+        if not any(self._compressed):
+            self.len = (
+                len(self._head)
+                + sum(len(file_head) + 2 for file_head in self._file_heads)
+                + sum(os.path.getsize(path) for path, _ in project_files)
+                + len(self._tail))
+
+    def __iter__(self):
+        self.sent = 0
+        self.hashes = {}
+        for part in self._parts():
+            self.sent += len(part)
+            yield part
+
+    def _parts(self):
+        yield self._head
+
+        for (path, _), file_head, compressed in zip(
+            self.project_files, self._file_heads, self._compressed):
+            yield file_head
+            yield from self._iter_file(path, compressed)
+            yield b"\r\n"
+
+        yield self._tail
+
+    def _iter_file(self, path, compress):
+        digest = hashlib.sha256()
+
+        def _read(fi):
+            for chunk in iter(lambda: fi.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                yield chunk
+
+        with open(path, mode="rb") as fi:
+            chunks = _read(fi)
+
+            if compress:
+                compressor = zlib.compressobj(
+                    UPLOAD_COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                for chunk in chunks:
+                    chunk = compressor.compress(chunk)
+                    if chunk:
+                        yield chunk
+                yield compressor.flush()
+            else:
+                yield from chunks
+
+        self.hashes[str(path)] = digest.hexdigest()
+
+def _quote_filename(filename):
+    return filename.replace("\\", "\\\\").replace("\"", "\\\"")
+
+def set_pool_maxsize(pool_maxsize):
+    """number of pooled connections of all clients created from now on"""
+    global _pool_maxsize
+    _pool_maxsize = pool_maxsize or DEFAULT_POOL_MAXSIZE
+
+def set_request_timeout(timeout):
+    """(connect, read) timeout of all clients created from now on"""
+    global _request_timeout
+    _request_timeout = timeout or DEFAULT_REQUEST_TIMEOUT
+
+def get_request_timeout():
+    return _request_timeout
+
+def thread_clients():
+    """clients of the current thread by (host, port)"""
+    clients = getattr(_local, "clients", None)
+    if clients is None:
+        clients = _local.clients = {}
+
+    return clients
+
+def get_client(host, port, pool_maxsize=None):
+    """return the client of the current worker for the given host,
+    created on first use and kept for the whole worker life"""
+    clients = thread_clients()
+
+    key = (host, str(port))
+
+    if key not in clients:
+        clients[key] = OpenRefineClient(
+            host, port, pool_maxsize=pool_maxsize or _pool_maxsize, timeout=_request_timeout)
+
+    return clients[key]
+
+def close_clients(clients=None):
+    """close all clients of the current worker, or the given clients of
+    thread_clients() of another thread"""
+    if clients is None:
+        clients = getattr(_local, "clients", {})
+    for client in clients.values():
+        client.close()
+    clients.clear()
+
+def _get_csrf_token(host, port, pid, client=None, refresh=False):
+    """required for all post requests against the openrefine api,
+    cached per host by the client"""
+    client = client or get_client(host, port)
+
     try:
-        resp_csrf_token = requests.get(
-            f"http://{host}:{port}/command/core/get-csrf-token")
+        return client.csrf_token(refresh=refresh)
     except requests.exceptions.RequestException as exc:
         logger.error(f"[pid {pid}] unable to get csrf-token, error was:\n{exc}")
         raise
 
-    return resp_csrf_token.json()["token"]
+def _estimate_async_remaining(processes, elapsed):
+    """estimate the seconds left for the currently running async process
+    from its reported progress (in percent), None if there is no estimate"""
+    progress = max(
+        (process.get("progress") or 0 for process in processes), default=0)
+
+    if progress <= 0 or progress >= 100:
+        return None
+
+    return elapsed * (100 - progress) / progress
+
+def _next_poll_interval(poll_interval, remaining=None):
+    """jittered sleep time for the current poll interval, but not
+    (much) longer than the estimated remaining time"""
+    sleep_time = random.uniform(poll_interval / 2, poll_interval)
+
+    if remaining is not None:
+        sleep_time = min(sleep_time, max(ASYNC_POLL_MIN, remaining))
+
+    return sleep_time
 
 def _check_async(
     host,
     port,
     pid,
-    project_id):
+    project_id,
+    client=None,
+    timeout=None):
     """check for project related async processes in the backround,
-    prevents premature project application"""
+    prevents premature project application
+
+    The poll interval starts short and grows with jitter up to a cap,
+    a TimeoutError is raised if the processes are not finished within
+    timeout seconds (no limit if None).
+    """
+    client = client or get_client(host, port)
+
     logger.info(f"[pid {pid}] check for project \"{project_id}\" related async processes")
 
     params = {"project": f"{project_id}"}
@@ -36,18 +424,20 @@ def _check_async(
         if (async_proc_num < _async_proc_num or _async_proc_num == 0):
             logger.info(f"[pid {pid}] number of async processes: {async_proc_num}")
 
+    started = monotonic()
+    poll_interval = ASYNC_POLL_MIN
+
     while True:
         async_processes = None
         try:
-            async_processes = requests.get(
-                f"http://{host}:{port}/command/core/get-processes?",
-                params=params)
+            async_processes = client.get("get-processes", params=params)
         except requests.exceptions.RequestException as exc:
             logger.error(f"[pid {pid}] unable to get state of project \"{project_id}\" related "
                          f"async processes, error was:\n{exc}")
             raise
 
-        async_proc_num = len(async_processes.json()["processes"])
+        processes = async_processes.json()["processes"]
+        async_proc_num = len(processes)
 
         _log_async_proc_num(async_proc_num, _async_proc_num)
 
@@ -57,7 +447,31 @@ def _check_async(
             logger.info(f"[pid {pid}] no more project \"{project_id}\" related async processes")
             return True
 
-        sleep(1)
+        elapsed = monotonic() - started
+
+        if timeout is not None and elapsed >= timeout:
+            logger.error(
+                f"[pid {pid}] project \"{project_id}\" related async processes "
+                f"not finished after {timeout} seconds")
+            raise TimeoutError(
+                f"project \"{project_id}\" related async processes "
+                f"not finished after {timeout} seconds")
+
+        remaining = _estimate_async_remaining(processes, elapsed)
+
+        if remaining is not None:
+            logger.debug(
+                f"[pid {pid}] project \"{project_id}\" related async processes "
+                f"estimated to finish in {remaining:.1f} seconds")
+
+        sleep_time = _next_poll_interval(poll_interval, remaining)
+
+        if timeout is not None:
+            sleep_time = min(sleep_time, timeout - elapsed)
+
+        sleep(sleep_time)
+
+        poll_interval = min(ASYNC_POLL_MAX, poll_interval * 2)
 
 def create_or_project(
     host,
@@ -66,24 +480,45 @@ def create_or_project(
     project_file,
     project_name,
     source_format,
-    options):
+    options,
+    client=None,
+    compress=False,
+    stats=None,
+    hashes=None):
     """Create openrefine project.
 
+    The project file is streamed to openrefine, optionally gzip compressed
+    on the fly (openrefine decompresses it during the import). Compressed
+    (gz, bz2) project files and zip archives are uploaded as they are,
+    openrefine imports them directly. Several
+    files can be imported into the same project by passing a list, they
+    are uploaded by their file names (use the includeFileSources option to
+    tell their rows apart).
+
     Args:
         host:           base url of the used openrefine host
         port:           openrefine port
         pip:            process id
-        project_file:   source file
+        project_file:   source file (or list of source files)
         project_name:   name of the openrefine project
         source_format:  format of the source data (limited to csv or xml)
         options:        e.g. encoding and recordPath
                         ({"encoding": "UTF-8", "recordPath": ["Records", "record"]})
+        client:         optional client to use, defaults to the worker client
+        compress:       gzip compress the upload
+        stats:          optional dict, the uploaded bytes are added to its
+                        "bytes_sent"
+        hashes:         optional dict, the sha256 hex digests of the
+                        uploaded files are added to it by path, hashed
+                        while they are read for the upload
 
     Returns:
         project_id:     id of the created openrefine project
     """
 
-    csrf_token = _get_csrf_token(host, port, pid)
+    client = client or get_client(host, port)
+
+    _get_csrf_token(host, port, pid, client=client)
 
     payload = {
         "project-name": project_name,}
@@ -94,19 +529,35 @@ def create_or_project(
     if options is not None:
         payload.update({"options": f"{json.dumps(options)}"})
 
-    files = {"project-file": (project_file, open(project_file, "rb"))}
+    if isinstance(project_file, (list, tuple)):
+        project_files = [
+            (str(file), pathlib.Path(file).name) for file in project_file]
+    else:
+        project_files = [(project_file, str(project_file))]
+
+    upload = _MultipartUpload(
+        fields=payload,
+        file_field="project-file",
+        project_files=project_files,
+        compress=compress)
 
     resp_project_create = None
 
     try:
-        resp_project_create = requests.post(
-            f"http://{host}:{port}/command/core/create-project-from-upload?csrf_token={csrf_token}",
-            data=payload, files=files)
+        resp_project_create = client.post(
+            "create-project-from-upload",
+            data=upload,
+            headers={"Content-Type": upload.content_type})
     except requests.exceptions.RequestException as exc:
         logger.error(
             f"[pid {pid}] unable to create project for file \"{project_file}\", "
             f"error was:\n{exc}")
         raise
+    finally:
+        if stats is not None:
+            stats["bytes_sent"] = stats.get("bytes_sent", 0) + upload.sent
+        if hashes is not None:
+            hashes.update(upload.hashes)
 
     url_frag = urlparse(resp_project_create.request.url)
 
@@ -123,7 +574,10 @@ def apply_or_project(
     port,
     pid,
     project_id,
-    or_project):
+    or_project,
+    client=None,
+    async_timeout=None,
+    stats=None):
     """Apply rules to openrefine project.
 
     Args:
@@ -133,12 +587,19 @@ def apply_or_project(
         project_id:     id of the created openrefine project
         or_project:     python object that results in a json dump string of all
                         project related rules
+        client:         optional client to use, defaults to the worker client
+        async_timeout:  max seconds to wait for pending async processes
+                        (no limit if None)
+        stats:          optional dict, the seconds waited for async processes
+                        are added to its "async_seconds"
 
     Returns:
         response code:  openrefine api response code, "ok" if application succeeded
     """
 
-    csrf_token = _get_csrf_token(host, port, pid)
+    client = client or get_client(host, port)
+
+    _get_csrf_token(host, port, pid, client=client)
 
     payload = {
         "project": project_id,
@@ -147,8 +608,8 @@ def apply_or_project(
     resp_project_apply = None
 
     try:
-        resp_project_apply = requests.post(
-            f"http://{host}:{port}/command/core/apply-operations?csrf_token={csrf_token}",
+        resp_project_apply = client.post(
+            "apply-operations",
             data=payload)
     except requests.exceptions.RequestException as exc:
         logger.error(
@@ -159,12 +620,36 @@ def apply_or_project(
     if resp_project_apply.json()["code"] == "ok":
         logger.info(f"[pid {pid}] applied project id \"{project_id}\"")
         return True
-    elif (resp_project_apply.json()["code"] == "pending"
-        and _check_async(host, port, pid, project_id) == True):
-            logger.info(f"[pid {pid}] applied project id \"{project_id}\"")
-            return True
-    else:
-        return False
+    elif resp_project_apply.json()["code"] == "pending":
+        async_started = monotonic()
+        try:
+            if _check_async(
+                host, port, pid, project_id,
+                client=client, timeout=async_timeout) == True:
+                logger.info(f"[pid {pid}] applied project id \"{project_id}\"")
+                return True
+        finally:
+            if stats is not None:
+                stats["async_seconds"] = (
+                    stats.get("async_seconds", 0) + monotonic() - async_started)
+
+    return False
+
+def export_file_path(project_file, export_dir, suffix=".csv", source_dir=None):
+    """path of the export file related to a project source file, without
+    the compression suffix of the source file, source files below
+    source_dir keep their subdirectory below the export dir"""
+    name = strip_compression(project_file).with_suffix(suffix).name
+
+    if source_dir is not None:
+        try:
+            relative = pathlib.Path(project_file).parent.relative_to(source_dir)
+        except ValueError:
+            relative = None
+        if relative is not None and relative.parts:
+            return f"{export_dir}/{relative.as_posix()}/{name}"
+
+    return f"{export_dir}/{name}"
 
 def export_or_project_rows(
     host,
@@ -173,38 +658,60 @@ def export_or_project_rows(
     project_id,
     export_format,
     project_file,
-    export_dir):
+    export_dir,
+    client=None,
+    stats=None,
+    template=None,
+    file_suffix=None,
+    source_dir=None):
     """Export all project related rows from openrefine.
 
-    The export file format is limited to csv only!
+    The response is streamed to disk, so memory usage doesn't depend on the
+    size of the export. Text exports are written utf-8 encoded, binary ones
+    (e.g. xlsx) as they are.
 
     Args:
         host:           base url of the used openrefine host
         port:           openrefine port
         pip:            process id
         project_id:     id of the created openrefine project
-        export_format:  limited to csv
+        export_format:  openrefine export format, e.g. csv, tsv, xlsx or template
         project_file:   project source file
         export_dir:     path of the directory to export to
+        client:         optional client to use, defaults to the worker client
+        stats:          optional dict, the exported bytes are added to its
+                        "bytes_received"
+        template:       template, prefix, suffix and separator of the
+                        template export format
+        file_suffix:    suffix of the export file, defaults to the one of
+                        the export format
+        source_dir:     optional source dir, the subdirectory of the project
+                        file below it is kept below the export dir
 
     Returns:
-        export_file:    path to the exported csv file
+        export_file:    path to the exported file
     """
 
     export_file = None
 
-    csrf_token = _get_csrf_token(host, port, pid)
+    client = client or get_client(host, port)
+
+    _get_csrf_token(host, port, pid, client=client)
 
     payload = {
         "project": project_id,
         "format": export_format}
 
+    if template is not None:
+        payload.update(template)
+
     resp_project_rows_export = None
 
     try:
-        resp_project_rows_export = requests.post(
-            f"http://{host}:{port}/command/core/export-rows?csrf_token={csrf_token}",
-            data=payload)
+        resp_project_rows_export = client.post(
+            "export-rows",
+            data=payload,
+            stream=True)
     except requests.exceptions.RequestException as exc:
         logger.error(
             f"[pid {pid}] unable to export or project id \"{project_id}\", "
@@ -212,12 +719,22 @@ def export_or_project_rows(
         raise
 
     if resp_project_rows_export is not None:
-        export_file = (
-            f"{export_dir}/"
-            f"{str(pathlib.Path(project_file).with_suffix('.csv').name)}")
+        export_file = export_file_path(
+            project_file,
+            export_dir,
+            file_suffix or EXPORT_SUFFIXES.get(export_format, f".{export_format}"),
+            source_dir=source_dir)
 
-        with(open(file=export_file, mode="w", encoding="UTF-8")) as fo:
-            fo.write(resp_project_rows_export.text)
+        try:
+            size = _stream_to_file(resp_project_rows_export, export_file, encoding="UTF-8")
+        except requests.exceptions.RequestException as exc:
+            logger.error(
+                f"[pid {pid}] unable to stream export of or project id \"{project_id}\" "
+                f"to export file \"{export_file}\", error was:\n{exc}")
+            raise
+
+        if stats is not None:
+            stats["bytes_received"] = stats.get("bytes_received", 0) + size
 
         logger.info(
             f"[pid {pid}] exported or project with id \"{project_id}\" "
@@ -229,7 +746,8 @@ def delete_or_project(
     host,
     port,
     pid,
-    project_id):
+    project_id,
+    client=None):
     """Delete openrefine project.
 
     Args:
@@ -237,20 +755,23 @@ def delete_or_project(
         port:           openrefine port
         pip:            process id
         project_id:     id of the created openrefine project
+        client:         optional client to use, defaults to the worker client
 
     Returns:
         response code:  openrefine api response code, "ok" if deletion succeeded
     """
 
-    csrf_token = _get_csrf_token(host, port, pid)
+    client = client or get_client(host, port)
+
+    _get_csrf_token(host, port, pid, client=client)
 
     payload = {"project": project_id}
 
     resp_project_delete = None
 
     try:
-        resp_project_delete = requests.post(
-            f"http://{host}:{port}/command/core/delete-project?csrf_token={csrf_token}",
+        resp_project_delete = client.post(
+            "delete-project",
             data=payload)
     except requests.exceptions.RequestException as exc:
         logger.error(
@@ -260,3 +781,31 @@ def delete_or_project(
     logger.info(f"[pid {pid}] deleted or project with id \"{project_id}\"")
 
     return resp_project_delete.json()["code"]
+
+def get_or_projects_metadata(
+    host,
+    port,
+    pid,
+    client=None):
+    """Get the metadata of all openrefine projects.
+
+    Args:
+        host:           base url of the used openrefine host
+        port:           openrefine port
+        pip:            process id
+        client:         optional client to use, defaults to the worker client
+
+    Returns:
+        projects:       project id to metadata (e.g. name, created and tags)
+    """
+
+    client = client or get_client(host, port)
+
+    try:
+        resp_projects = client.get("get-all-project-metadata")
+    except requests.exceptions.RequestException as exc:
+        logger.error(
+            f"[pid {pid}] unable to get or projects metadata, error was:\n{exc}")
+        raise
+
+    return resp_projects.json()["projects"]
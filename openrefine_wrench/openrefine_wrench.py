@@ -1,12 +1,54 @@
 import logging
 import logging.config
+import os
 import pathlib
+import random
+import shutil
+import tempfile
 import uuid
 import json
+import asyncio
+import heapq
+import itertools
+import threading
 import click
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from multiprocessing import Pool
 from os import getpid
+from time import monotonic, sleep
+from openrefine_wrench import standin
+from openrefine_wrench.batching import batch_files, split_export
+from openrefine_wrench.profiling import OperationProfile, profile_apply
+from openrefine_wrench.routing import Router
+from openrefine_wrench.project_gc import collect_projects, project_tags
+from openrefine_wrench.compression import is_archive, strip_compression
+from openrefine_wrench.discovery import discover_files, filter_files, read_source_list
+from openrefine_wrench.concurrency import MEMORY_FACTORS, AdaptiveConcurrency, MemoryBudget
+from openrefine_wrench.benchmark import BENCHMARK_MAPPINGS, format_report, generate_dataset
+from openrefine_wrench.journal import Journal, source_stats
+from openrefine_wrench.manifest import Manifest, file_hash, settings_hash
+from openrefine_wrench.metrics import RunMetrics
+from openrefine_wrench.sink import ExportSink
+from openrefine_wrench.sharding import (
+    merge_exports,
+    non_row_local_operations,
+    shard_file)
+from openrefine_wrench.backends import (
+    BackendPool,
+    parse_backend,
+    read_backends_file)
 from openrefine_wrench.openrefine_api_calls import (
+    DEFAULT_REQUEST_TIMEOUT,
+    EXPORT_SUFFIXES,
+    export_file_path,
+    get_client,
+    is_transient_error,
+    close_clients,
+    thread_clients,
+    set_pool_maxsize,
+    get_request_timeout,
+    set_request_timeout,
     create_or_project,
     apply_or_project,
     export_or_project_rows,
@@ -14,7 +56,33 @@ from openrefine_wrench.openrefine_api_calls import (
 
 logger = None
 
-def _prep_logger(log_level, logfile):
+# placement of projects on several openrefine backends, None if all jobs
+# go to the same host
+_backends = None
+
+# journal of the stage transitions of the run, None if not journaled
+_journal = None
+
+# threads fetching the further export formats of the jobs, created on first
+# use, their clients are kept for all jobs of the worker
+EXPORT_THREADS = 16
+_export_executor = None
+_export_clients = []
+_export_lock = threading.Lock()
+
+# stages failed with a transient error are retried with exponential backoff
+# starting from retry_backoff seconds up to RETRY_BACKOFF_MAX seconds
+RETRIES = 3
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 60.0
+
+FAILED_FILES = ".openrefine-wrench-failed.jsonl"
+
+# source files are sorted by their cost within windows of this number of
+# files, so that processing starts before all files are found
+SORT_WINDOW = 10000
+
+def _prep_logger(log_level, logfile, mode="w"):
     logging_config = {
         "version": 1,
         "disable_existing_loggers": False,
@@ -32,7 +100,7 @@ def _prep_logger(log_level, logfile):
                 "formatter": "standard",
                 "class": "logging.FileHandler",
                 "filename": str(logfile),
-                "mode": "w"}},
+                "mode": mode}},
         "loggers": {
             "": {# root logger
                 "handlers": ["default"],
@@ -88,99 +156,871 @@ def _prep_options(
 
     return options
 
-def _pool_handler(
-    host,
-    port,
+def _prep_exports(export_formats, export_templates):
+    """Export formats besides csv, templates are json files with the
+    template, prefix, suffix and separator of the template export format
+    and the extension of the export files (default json).
+
+    Returns:
+        exports:        format, export file suffix and template per export
+    """
+    exports = [
+        {"format": export_format, "suffix": EXPORT_SUFFIXES[export_format]}
+        for export_format in export_formats]
+
+    for export_template in export_templates:
+        with(open(file=export_template, mode="r", encoding="UTF-8")) as fi:
+            template = json.loads(fi.read())
+        extension = template.pop("extension", "json").lstrip(".")
+        exports.append({"format": "template", "suffix": f".{extension}", "template": template})
+
+    suffixes = [".csv"] + [export["suffix"] for export in exports]
+    if len(set(suffixes)) != len(suffixes):
+        raise click.BadParameter(
+            "export files of different formats would have the same extension",
+            param_hint="--export-format/--export-template")
+
+    return exports
+
+def _prep_jobs(source_files, **settings):
+    """one job per source file, each job carries the run settings and
+    collects the state of the file processing stages"""
+    for file in source_files:
+        yield dict(settings, project_file=str(file))
+
+def _prep_batch_jobs(batches, **settings):
+    """one job per batch of source files, imported into the same project
+    with file sources included to split the export per file afterwards,
+    archives are jobs of their own"""
+    batch_options = dict(settings["options"], includeFileSources=True)
+
+    for batch in batches:
+        if len(batch) == 1 and is_archive(batch[0]):
+            yield dict(settings, project_file=batch[0])
+        else:
+            yield dict(settings, options=batch_options, project_file=batch[0], batch=batch)
+
+def _prep_shard_jobs(source_files, sharded, shard_bytes, record_path, **settings):
+    """Large source files are split into shards, processed as jobs of their
+    own. Each sharded file is recorded in sharded with its export file, the
+    shard directory, the shard exports to be merged after the run and the
+    source file."""
+    for file in source_files:
+        shard_dir, shards = shard_file(
+            file,
+            source_format=settings["source_format"],
+            shard_bytes=shard_bytes,
+            work_dir=settings["export_dir"],
+            record_path=record_path,
+            encoding=settings["options"].get("encoding") or "UTF-8")
+
+        if len(shards) <= 1:
+            shutil.rmtree(shard_dir)
+            yield dict(settings, project_file=str(file))
+            continue
+
+        sharded.append((
+            export_file_path(
+                file, settings["export_dir"], source_dir=settings.get("source_dir")),
+            shard_dir,
+            [export_file_path(shard, shard_dir) for shard in shards],
+            str(file)))
+
+        for shard in shards:
+            yield dict(
+                settings,
+                project_file=shard,
+                export_dir=shard_dir,
+                source_dir=None,
+                shard_of=str(file))
+
+def _costly_first(source_files, estimate, window=SORT_WINDOW):
+    """the source files in descending order of their estimated cost, sorted
+    within windows of window files (all at once if window is 0)"""
+    source_files = iter(source_files)
+
+    while True:
+        files = list(itertools.islice(source_files, window or None))
+        if not files:
+            return
+        yield from sorted(files, key=estimate, reverse=True)
+
+def _prep_all_jobs(
     source_files,
-    export_dir,
-    options,
-    or_project,
-    source_format,
-    max_workers):
+    sharded,
+    shard_bytes=None,
+    batch_max_files=1,
+    batch_max_bytes=None,
+    **settings):
+    """shard jobs of the source files larger than shard_bytes and the
+    (batch) jobs of the others"""
+    if shard_bytes is not None and non_row_local_operations(settings["or_project"]):
+        logger.warning(
+            "source files are not sharded, the mappings contain operations "
+            "which need the whole dataset: "
+            + ", ".join(non_row_local_operations(settings["or_project"])))
+        shard_bytes = None
 
-    params = [(
-        host,
-        port,
-        str(file),
-        export_dir,
-        options,
-        source_format,
-        or_project) for file in source_files]
+    shard_jobs = []
+    if shard_bytes is not None:
+        source_files = list(source_files)
+        large_files = [
+            file for file in source_files
+            if file.stat().st_size > shard_bytes and not is_archive(file)]
+        source_files = [file for file in source_files if file not in large_files]
+        shard_jobs = _prep_shard_jobs(
+            large_files,
+            sharded,
+            shard_bytes=shard_bytes,
+            record_path=list(settings["options"].get("recordPath") or []),
+            **settings)
+
+    if batch_max_files > 1 or batch_max_bytes is not None:
+        jobs = _prep_batch_jobs(
+            batch_files(source_files, batch_max_files, batch_max_bytes), **settings)
+    else:
+        jobs = _prep_jobs(source_files, **settings)
+
+    return shard_jobs, jobs
+
+def _routed_files(source_files, router):
+    """the source files with a route, each file once"""
+    seen = set()
+    skipped = 0
+    for file in source_files:
+        key = pathlib.Path(file).resolve()
+        if key in seen:
+            continue
+        seen.add(key)
+        if router.route(file) is None:
+            skipped += 1
+            continue
+        yield pathlib.Path(file)
+
+    if skipped:
+        logger.warning(f"skipped {skipped} source files matched by no route")
+
+def _group_by_route(source_files, router):
+    """(route, source files) per route, routes are told apart by identity
+    as their names need not be unique"""
+    routed = {}
+    for file in source_files:
+        route = router.route(file)
+        routed.setdefault(id(route), (route, []))[1].append(file)
+
+    return list(routed.values())
+
+def _unique_exports(source_files, export_path, failed, per_dir=False):
+    """the source files whose export file isn't taken by another source
+    file of the run, the others fail without a job
+
+    With per_dir the source files come one directory at a time (as found by
+    discover_files) and keep their subdirectory below the export dir, so
+    only files of the same directory (e.g. x.csv and x.csv.gz) can share an
+    export file and only the claims of the current directory are kept.
+    """
+    claimed = {}
+    claimed_dir = None
+    for file in source_files:
+        export_file = pathlib.Path(export_path(file)).resolve()
+        if per_dir and export_file.parent != claimed_dir:
+            claimed.clear()
+            claimed_dir = export_file.parent
+        export_file = str(export_file)
+        source_file = pathlib.Path(file).resolve()
+        if claimed.setdefault(export_file, source_file) != source_file:
+            message = f"export file {export_path(file)} is taken by source file {claimed[export_file]}"
+            logger.error(f"[pid {getpid()}] skip source file {file}, {message}")
+            failed.append({
+                "project_file": str(file),
+                "error": {"stage": "prep", "type": "ValueError", "message": message}})
+            continue
+        yield file
+
+def _merge_shards(sharded, on_merged=None, failed=()):
+    for export_file, _, shard_exports, source_file in sharded:
+        if source_file in failed:
+            continue
+        merge_exports(shard_exports, export_file)
+        if on_merged is not None:
+            on_merged(source_file, export_file)
+
+def _job_sources(job):
+    """source files of a job, the sharded source file for shard jobs"""
+    if "shard_of" in job:
+        return [job["shard_of"]]
+
+    return job.get("batch") or [job["project_file"]]
+
+def _sink_exports(sink, exports):
+    """append staged exports to the output file and remove them"""
+    try:
+        for source_file, export_file in exports:
+            sink.add(export_file, source_file=source_file)
+    finally:
+        for _, export_file in exports:
+            if os.path.exists(export_file):
+                os.remove(export_file)
+
+def _job_exports(job):
+    """source files of a job along with their export files"""
+    if "shard_of" in job:
+        return []
+
+    if "batch" in job:
+        return [
+            (file, export_file_path(file, job["export_dir"], source_dir=job.get("source_dir")))
+            for file in job["batch"]]
+
+    return [(job["project_file"], job["export_file"])]
+
+def _resume_jobs(jobs, journal):
+    """take over the applied projects of an interrupted run, their jobs
+    continue with the stage after the last finished one"""
+    stage_names = [name for name, _ in STAGES]
+
+    for job in jobs:
+        resumed = journal.take(job["project_file"], job.get("batch") or [job["project_file"]])
+        if resumed is not None:
+            job.update(
+                host=resumed["host"],
+                port=resumed["port"],
+                project_id=resumed["project_id"],
+                project_name=resumed["project_name"],
+                resume_at=stage_names.index(resumed["stage"]) + 1)
+            logger.info(
+                f"[pid {getpid()}] resume {_describe(job)} with project id "
+                f"\"{job['project_id']}\" after {resumed['stage']} stage")
+        yield job
+
+def _cleanup_projects(jobs):
+    """delete the projects of unfinished jobs of a previous run, returns the
+    jobs whose project couldn't be deleted"""
+    failed = []
+    for job in jobs:
+        try:
+            delete_or_project(
+                host=job["host"],
+                port=job["port"],
+                pid=getpid(),
+                project_id=job["project_id"])
+        except (requests.exceptions.RequestException, ValueError):
+            failed.append(job)
+
+    return failed
 
-    with(Pool(max_workers)) as p:
+def _collect_garbage(servers, keep=(), **selection):
+    """garbage collect the openrefine-wrench projects on all servers, a
+    failed collection doesn't fail the run"""
+    for host, port in servers:
+        try:
+            collect_projects(host=host, port=port, pid=getpid(), keep=keep, **selection)
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            logger.warning(
+                f"[pid {getpid()}] garbage collection on {host}:{port} failed, error was:\n{exc}")
+
+def _log_profile(operation_profile, profile_file=None, mode="w"):
+    logger.info(
+        f"seconds per operation of {operation_profile.mappings_file} over "
+        f"{operation_profile.projects} projects:\n"
+        + operation_profile.format_report())
+    if profile_file is not None:
+        operation_profile.write(profile_file, mode=mode)
+
+def _write_failed_files(failed_files, failed):
+    """one json line per failed source file with the stage and error of
+    its job, the report can be passed back in as source list"""
+    reported = set()
+    with(open(file=failed_files, mode="w", encoding="UTF-8")) as fo:
+        for job in failed:
+            for source_file in _job_sources(job):
+                if source_file not in reported:
+                    reported.add(source_file)
+                    fo.write(json.dumps(dict(job["error"], source_file=source_file)) + "\n")
+
+    return reported
+
+def _job_record(job):
+    """metrics record of a finished job, shards are recorded on their own"""
+    stats = job.get("stats", {})
+    stages = dict(job.get("stage_seconds", {}))
+    if "async_seconds" in stats:
+        stages["async_wait"] = stats["async_seconds"]
+
+    record = {
+        "source_files": job.get("batch") or [job["project_file"]],
+        "status": "failed" if "error" in job else "ok",
+        "stages": stages,
+        "seconds": sum(job.get("stage_seconds", {}).values()),
+        "bytes_sent": stats.get("bytes_sent", 0),
+        "bytes_received": stats.get("bytes_received", 0),
+        "retries": job.get("retried", 0)}
+
+    if "shard_of" in job:
+        record["shard_of"] = job["shard_of"]
+    if "error" in job:
+        record["error"] = job["error"]
+
+    return record
+
+def _describe(job):
+    if "batch" in job:
+        return f"batch of {len(job['batch'])} files starting with {job['project_file']}"
+
+    return f"file {job['project_file']}"
+
+def _pool_handler(
+    jobs,
+    max_workers,
+    pool_maxsize=None,
+    stage_workers=None,
+    on_done=None):
+    """run the jobs in a pool of worker processes
+
+    The pool takes its tasks from the jobs as fast as it can, so at most
+    twice max_workers jobs are handed to it ahead of their results.
+    """
+    queued = threading.Semaphore(2 * max_workers)
+    closed = threading.Event()
+
+    def _queue(jobs):
+        for job in jobs:
+            queued.acquire()
+            if closed.is_set():
+                return
+            yield job
+
+    with(Pool(
+        max_workers,
+        initializer=_init_worker,
+        initargs=(pool_maxsize, _backends, _journal, get_request_timeout()))) as p:
         logger.info(f"we spawn over {max_workers} workers")
-        p.starmap(_run_or_processing, params)
+        try:
+            for job in p.imap_unordered(_run_or_processing, _queue(jobs), chunksize=1):
+                queued.release()
+                if on_done is not None:
+                    on_done(job)
+        finally:
+            # the pool waits for its task thread when it's terminated
+            closed.set()
+            queued.release()
 
-def _run_or_processing(
-    host,
-    port,
-    project_file,
-    export_dir,
-    options,
-    source_format,
-    or_project):
+def _init_worker(pool_maxsize, backends=None, journal=None, request_timeout=None):
+    """worker clients are created on first use and reused for the whole
+    worker life"""
+    global _backends, _journal
+    _backends = backends
+    _journal = journal
 
-    pid = getpid()
+    # connections inherited from the parent process must not be shared
+    close_clients()
+    set_pool_maxsize(pool_maxsize)
+    set_request_timeout(request_timeout)
 
-    logger.info(f"[pid {pid}] start or processing for file {project_file}")
+def _asyncio_handler(
+    jobs,
+    max_workers,
+    pool_maxsize=None,
+    stage_workers=None,
+    on_done=None):
+    """run the jobs as coroutines in a single process
 
-    project_name = f"{pathlib.Path(project_file).stem}_{uuid.uuid4()}"
+    Up to max_workers jobs are in flight at once, their blocking api calls
+    are handed to a thread pool of the same size. The jobs are taken from
+    a thread of their own, as preparing (or admitting) them may block.
+    """
+    set_pool_maxsize(pool_maxsize)
 
-    project_id = create_or_project(
-        host=host,
-        port=port,
-        pid=pid,
-        project_file=project_file,
-        project_name=project_name,
-        source_format=source_format,
-        options=options)
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers)
+    feeder = ThreadPoolExecutor(1)
+    jobs = iter(jobs)
 
-    apply_or_project(
-        host=host,
-        port=port,
-        pid=pid,
-        project_id=project_id,
-        or_project=or_project)
+    workers = [
+        loop.create_task(_asyncio_worker(loop, executor, feeder, jobs, on_done))
+        for _ in range(max_workers)]
 
-    export_or_project_rows(
-        host=host,
-        port=port,
-        pid=pid,
-        project_id=project_id,
+    logger.info(f"we run up to {max_workers} coroutines")
+
+    try:
+        loop.run_until_complete(asyncio.gather(*workers))
+    except BaseException:
+        for worker in workers:
+            worker.cancel()
+        loop.run_until_complete(asyncio.gather(*workers, return_exceptions=True))
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        feeder.shutdown(wait=True)
+        _shutdown_export_executor()
+        loop.close()
+
+def _pipeline_handler(
+    jobs,
+    max_workers,
+    pool_maxsize=None,
+    stage_workers=None,
+    on_done=None):
+    """run the jobs through a pipeline of stages in a single process
+
+    Every stage has its own thread pool, sized by stage_workers (stage name
+    to number of workers, defaults to max_workers). Jobs are handed to the
+    next stage as soon as they are done with the current one, max_workers
+    limits the number of projects in flight (created but not yet deleted).
+    An error of on_done stops taking new jobs, it is raised once the jobs
+    in flight are done.
+    """
+    set_pool_maxsize(pool_maxsize)
+
+    stage_workers = stage_workers or {}
+    executors = [
+        ThreadPoolExecutor(stage_workers.get(name) or max_workers)
+        for name, _ in STAGES]
+
+    in_flight = threading.BoundedSemaphore(max_workers)
+    pending = threading.Condition()
+    pending_jobs = 0
+    errors = []
+
+    logger.info(
+        f"we run a pipeline with up to {max_workers} projects in flight and "
+        + ", ".join(
+            f"{stage_workers.get(name) or max_workers} {name} workers"
+            for name, _ in STAGES))
+
+    def _finish(job):
+        nonlocal pending_jobs
+        # the project is gone, the next one may be created meanwhile
+        in_flight.release()
+        try:
+            if on_done is not None:
+                with pending:
+                    on_done(job)
+        except BaseException as exc:
+            errors.append(exc)
+        finally:
+            with pending:
+                pending_jobs -= 1
+                pending.notify_all()
+
+    def _advance(index, job):
+        name, stage = STAGES[index]
+        try:
+            _run_stage(name, stage, job)
+        except Exception as exc:
+            _fail_job(name, job, exc)
+
+        if "error" in job or index + 1 == len(STAGES):
+            _finish(job)
+        else:
+            executors[index + 1].submit(_advance, index + 1, job)
+
+    try:
+        for job in jobs:
+            in_flight.acquire()
+            if errors:
+                in_flight.release()
+                break
+            with pending:
+                pending_jobs += 1
+            start = job.get("resume_at", 0)
+            executors[start].submit(_advance, start, job)
+
+        with pending:
+            pending.wait_for(lambda: pending_jobs == 0)
+
+        if errors:
+            raise errors[0]
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+        _shutdown_export_executor()
+
+async def _asyncio_worker(loop, executor, feeder, jobs, on_done=None):
+    """take the next job as soon as the current one is done"""
+    while True:
+        job = await loop.run_in_executor(feeder, next, jobs, None)
+        if job is None:
+            break
+
+        logger.info(f"[pid {getpid()}] start or processing for {_describe(job)}")
+
+        for name, stage in STAGES[job.get("resume_at", 0):]:
+            try:
+                await loop.run_in_executor(executor, _run_stage, name, stage, job)
+            except Exception as exc:
+                await loop.run_in_executor(executor, _fail_job, name, job, exc)
+                break
+        else:
+            logger.info(f"[pid {getpid()}] done with or processing for {_describe(job)}")
+
+        if on_done is not None:
+            on_done(job)
+
+def _tag_options(options, run_id):
+    """stamp the tags of the run on a new project, recognized by the
+    garbage collection"""
+    if run_id is None:
+        return options
+
+    return dict(
+        options,
+        projectTags=(options.get("projectTags") or []) + project_tags(run_id))
+
+def _create_stage(job):
+    if job.get("host") is None:
+        job["host"], job["port"] = _backends.acquire(memory=job.get("memory_estimate", 0))
+        job["placed"] = True
+
+    job["project_name"] = f"{strip_compression(job['project_file']).stem}_{uuid.uuid4()}"
+
+    job["project_id"] = create_or_project(
+        host=job["host"],
+        port=job["port"],
+        pid=getpid(),
+        project_file=job.get("batch") or job["project_file"],
+        project_name=job["project_name"],
+        source_format=job["source_format"],
+        options=_tag_options(job["options"], job.get("run_id")),
+        client=get_client(job["host"], job["port"]),
+        compress=job.get("compress_upload", False),
+        stats=job.setdefault("stats", {}),
+        hashes=job.setdefault("content_hashes", {}))
+
+def _apply_stage(job):
+    if job.get("profile_group_size"):
+        job["operation_seconds"] = profile_apply(
+            host=job["host"],
+            port=job["port"],
+            pid=getpid(),
+            project_id=job["project_id"],
+            or_project=job["or_project"],
+            group_size=job["profile_group_size"],
+            client=get_client(job["host"], job["port"]),
+            async_timeout=job.get("async_timeout"),
+            stats=job.setdefault("stats", {}))
+        applied = job["operation_seconds"] is not None
+    else:
+        applied = apply_or_project(
+            host=job["host"],
+            port=job["port"],
+            pid=getpid(),
+            project_id=job["project_id"],
+            or_project=job["or_project"],
+            client=get_client(job["host"], job["port"]),
+            async_timeout=job.get("async_timeout"),
+            stats=job.setdefault("stats", {}))
+
+    if not applied:
+        raise RuntimeError(
+            f"openrefine rejected the operations for project id \"{job['project_id']}\"")
+
+def _export_extra(job, export, stats):
+    return export_or_project_rows(
+        host=job["host"],
+        port=job["port"],
+        pid=getpid(),
+        project_id=job["project_id"],
+        export_format=export["format"],
+        project_file=job["project_file"],
+        export_dir=job["export_dir"],
+        client=get_client(job["host"], job["port"]),
+        stats=stats,
+        template=export.get("template"),
+        file_suffix=export["suffix"],
+        source_dir=job.get("source_dir"))
+
+def _export_stage(job):
+    project_file = job["project_file"]
+    if "batch" in job:
+        project_file = f".{job['project_name']}.csv"
+
+    if job.get("exports"):
+        # further formats of the same project, fetched along with the csv
+        extra_stats = [{} for _ in job["exports"]]
+        executor = _get_export_executor()
+        extra_exports = [
+            executor.submit(_export_extra, job, export, stats)
+            for export, stats in zip(job["exports"], extra_stats)]
+        try:
+            _export_csv(job, project_file)
+        finally:
+            # the further exports are done (or failed) before the job goes on
+            wait_futures(extra_exports)
+        job["extra_export_files"] = [export.result() for export in extra_exports]
+        job["stats"]["bytes_received"] = job["stats"].get("bytes_received", 0) + sum(
+            stats.get("bytes_received", 0) for stats in extra_stats)
+    else:
+        _export_csv(job, project_file)
+
+def _init_export_thread():
+    with _export_lock:
+        _export_clients.append(thread_clients())
+
+def _get_export_executor():
+    global _export_executor
+    with _export_lock:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(
+                EXPORT_THREADS, thread_name_prefix="export", initializer=_init_export_thread)
+
+        return _export_executor
+
+def _shutdown_export_executor():
+    """stop the export threads and close their clients"""
+    global _export_executor
+    with _export_lock:
+        executor, _export_executor = _export_executor, None
+    if executor is None:
+        return
+
+    executor.shutdown(wait=True)
+    with _export_lock:
+        for clients in _export_clients:
+            close_clients(clients)
+        _export_clients.clear()
+
+def _export_csv(job, project_file):
+    job["export_file"] = export_or_project_rows(
+        host=job["host"],
+        port=job["port"],
+        pid=getpid(),
+        project_id=job["project_id"],
         export_format="csv",
         project_file=project_file,
-        export_dir=export_dir)
+        export_dir=job["export_dir"],
+        client=get_client(job["host"], job["port"]),
+        stats=job.setdefault("stats", {}),
+        source_dir=job.get("source_dir"))
+
+    if "batch" in job:
+        try:
+            job["export_files"] = split_export(
+                job["export_file"], job["batch"], job["export_dir"],
+                source_dir=job.get("source_dir"))
+        finally:
+            os.remove(job.pop("export_file"))
 
+        logger.info(
+            f"[pid {getpid()}] split export of project with id \"{job['project_id']}\" "
+            f"into {len(job['export_files'])} export files")
+
+def _delete_stage(job):
     delete_or_project(
-        host=host,
-        port=port,
-        pid=pid,
-        project_id=project_id)
+        host=job["host"],
+        port=job["port"],
+        pid=getpid(),
+        project_id=job["project_id"],
+        client=get_client(job["host"], job["port"]))
+
+    _release_backend(job)
+
+STAGES = (
+    ("create", _create_stage),
+    ("apply", _apply_stage),
+    ("export", _export_stage),
+    ("delete", _delete_stage))
+
+def _place_job(job):
+    """place an admitted job on a backend with room for its memory, jobs
+    on a server already (e.g. resumed ones) stay there"""
+    if job.get("host") is None:
+        backend = _backends.acquire(memory=job.get("memory_estimate", 0), wait=False)
+        if backend is None:
+            return False
+        job["host"], job["port"] = backend
+        job["placed"] = True
+
+    return True
+
+def _release_backend(job):
+    """give back the backend of a placed job, a new project of the job is
+    placed again"""
+    if job.pop("placed", False):
+        _backends.release(job["host"], job["port"], memory=job.get("memory_estimate", 0))
+        job["host"] = job["port"] = None
+
+def _discard_project(job):
+    """delete the project of a job (with retries), if it has one, the
+    project id is kept if the project is left on openrefine"""
+    if job.get("project_id") is not None:
+        try:
+            _run_stage("delete", dict(STAGES)["delete"], job)
+            del job["project_id"]
+        except Exception:
+            logger.warning(
+                f"[pid {getpid()}] project with id \"{job['project_id']}\" "
+                f"of {_describe(job)} left on openrefine")
+
+    _release_backend(job)
+
+def _fail_job(name, job, exc):
+    """a job failed for good, its project is deleted and the run goes on
+    with the other jobs"""
+    job["error"] = {"stage": name, "type": type(exc).__name__, "message": str(exc)}
+
+    logger.error(
+        f"[pid {getpid()}] {name} stage failed for {_describe(job)}, "
+        f"error was:\n{exc}")
+
+    _discard_project(job)
+
+def _retry_delay(job, attempt):
+    """exponential backoff with jitter, so retries of many jobs against the
+    same backend are spread out"""
+    delay = min(RETRY_BACKOFF_MAX, job.get("retry_backoff", RETRY_BACKOFF) * 2 ** attempt)
+
+    return delay * random.uniform(0.5, 1.0)
+
+def _run_stage(name, stage, job):
+    """Run a single stage of a job, all engines run stages through here.
+
+    A stage failed with a transient error is retried up to the retries of
+    the job. The operations of a failed apply may have been partially
+    applied, so its retries start over with a new project.
+    """
+    retries = job.get("retries", 0)
+
+    for attempt in itertools.count():
+        try:
+            if attempt and name == "apply":
+                _discard_project(job)
+                _run_stage("create", dict(STAGES)["create"], job)
+            _attempt_stage(name, stage, job)
+            break
+        except Exception as exc:
+            if attempt >= retries or not is_transient_error(exc):
+                raise
+            delay = _retry_delay(job, attempt)
+            job["retried"] = job.get("retried", 0) + 1
+            logger.warning(
+                f"[pid {getpid()}] {name} stage failed for {_describe(job)}, "
+                f"retry {attempt + 1} of {retries} in {delay:.1f} seconds, "
+                f"error was:\n{exc}")
+            sleep(delay)
 
-    logger.info(f"[pid {pid}] done with or processing for file {project_file}")
+    if _journal is not None:
+        _record_stage(name, job)
+
+def _attempt_stage(name, stage, job):
+    started = monotonic()
+    try:
+        stage(job)
+    except requests.exceptions.RequestException:
+        if job.get("placed"):
+            _backends.failed(job["host"], job["port"])
+            if name == "create":
+                _release_backend(job)
+        raise
+    finally:
+        stage_seconds = job.setdefault("stage_seconds", {})
+        stage_seconds[name] = stage_seconds.get(name, 0) + monotonic() - started
+
+    if job.get("placed"):
+        _backends.succeeded(job["host"], job["port"])
+
+def _record_stage(name, job):
+    fields = {}
+    if name == "create":
+        fields.update(
+            host=job["host"],
+            port=job["port"],
+            project_id=job["project_id"],
+            project_name=job["project_name"],
+            sources=source_stats(job.get("batch") or [job["project_file"]]))
+    elif name == "export":
+        fields.update(exports=_job_exports(job))
+
+    _journal.record(job["project_file"], name, **fields)
+
+def _run_or_processing(job):
+    """run all stages of a single job one after another"""
+    pid = getpid()
+
+    logger.info(f"[pid {pid}] start or processing for {_describe(job)}")
+
+    for name, stage in STAGES[job.get("resume_at", 0):]:
+        try:
+            _run_stage(name, stage, job)
+        except Exception as exc:
+            _fail_job(name, job, exc)
+            return job
+
+    logger.info(f"[pid {pid}] done with or processing for {_describe(job)}")
+
+    return job
+
+HANDLERS = {
+    "pool": _pool_handler,
+    "asyncio": _asyncio_handler,
+    "pipeline": _pipeline_handler}
 
 @click.command()
 @click.option(
     "--host",
-    help="openrefine host",
-    required=True)
+    help="openrefine host (required unless backends are given)")
 @click.option(
     "--port",
     help="openrefine port (default to 3333)",
     default="3333",
     type=str,
     required=True)
+@click.option(
+    "--backend",
+    help="openrefine backend as host[:port], repeat to spread the projects "
+         "over several backends",
+    type=str,
+    multiple=True)
+@click.option(
+    "--backends-file",
+    help="file with one openrefine backend host[:port] per line",
+    type=str)
 @click.option(
     "--source-dir",
-    help="openrefine source data dir",
-    required=True)
+    help="openrefine source data dir (required unless a source list is given)")
+@click.option(
+    "--recursive",
+    help="also process the source files in the subdirectories of the source dir, "
+         "their exports are written to the same subdirectories of the export dir",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--source-list",
+    help="file with the source files to process, one per line (e.g. a failed files "
+         "report), - reads the list from stdin",
+    type=str)
+@click.option(
+    "--include",
+    help="only process source files whose name or (relative) path matches this glob "
+         "pattern (multiple)",
+    multiple=True)
+@click.option(
+    "--exclude",
+    help="skip source files whose name or (relative) path matches this glob pattern "
+         "(multiple)",
+    multiple=True)
+@click.option(
+    "--min-size",
+    help="skip source files smaller than this size in bytes",
+    type=int)
+@click.option(
+    "--max-size",
+    help="skip source files larger than this size in bytes",
+    type=int)
+@click.option(
+    "--sort-window",
+    help="sort the source files by their cost within windows of this number of files, "
+         f"processing starts once the first window is found (default {SORT_WINDOW}, "
+         "0 sorts all files)",
+    default=SORT_WINDOW,
+    type=int)
 @click.option(
     "--export-dir",
     help="openrefine export data dir",
     required=True)
 @click.option(
     "--source-format",
-    help="openrefine source data format",
+    help="openrefine source data format, also gz or bz2 compressed and in zip archives",
     type=click.Choice(["xml", "csv"], case_sensitive=False),
     required=True)
 @click.option(
@@ -199,16 +1039,195 @@ def _run_or_processing(
     help="columns separator (only applicable in conjunction with csv source format)",
     type=str,
     default=",")
+@click.option(
+    "--compress-upload",
+    help="gzip compress the source data on the fly while uploading",
+    is_flag=True,
+    default=False)
 @click.option(
     "--mappings-file",
-    help="openrefine mappings file",
-    required=True)
+    help="openrefine mappings file, with --routes-file the mappings of source files "
+         "matched by no route")
+@click.option(
+    "--routes-file",
+    help="json list of routes, each applying a mappings file and import options to "
+         "the source files of its source dir and/or matched by its pattern or regex",
+    type=str)
+@click.option(
+    "--export-format",
+    "export_formats",
+    help="export the projects in this format too, besides csv (multiple)",
+    type=click.Choice([
+        export_format for export_format in EXPORT_SUFFIXES
+        if export_format not in ("csv", "template")]),
+    multiple=True)
+@click.option(
+    "--export-template",
+    "export_templates",
+    help="json file of a template export (template, prefix, suffix, separator and "
+         "extension of the export files, default json) to export the projects "
+         "with too (multiple)",
+    type=str,
+    multiple=True)
+@click.option(
+    "--output-file",
+    help="append the csv exports of all projects to this one file instead of "
+         "an export file per source file, gzip compressed if it ends with .gz "
+         "(all source files are processed, as with --force)",
+    type=str)
+@click.option(
+    "--output-max-bytes",
+    help="roll the output file over to numbered files of about this many bytes "
+         "(uncompressed), each starting with the header",
+    type=click.IntRange(min=1))
+@click.option(
+    "--output-source-column",
+    help="name of a first column of the output file with the source file of each row",
+    type=str)
 @click.option(
     "--max-workers",
-    help="number of parallel processed openrefine projects",
-    default=1,
-    type=int,
+    help="number of parallel processed openrefine projects (processes or coroutines), "
+         "auto adapts it to the latencies and errors between the auto bounds",
+    default="1",
+    type=str,
     required=True)
+@click.option(
+    "--auto-min-workers",
+    help="lower bound of the parallel processed projects with auto max workers (default 1)",
+    default=1,
+    type=int)
+@click.option(
+    "--auto-max-workers",
+    help="upper bound of the parallel processed projects with auto max workers (default 16)",
+    default=16,
+    type=int)
+@click.option(
+    "--server-memory-budget",
+    help="max estimated memory of the projects in flight per openrefine server in "
+         "bytes, source size times the memory factor, larger files wait while "
+         "smaller ones go ahead",
+    type=int)
+@click.option(
+    "--memory-factor",
+    help="estimated openrefine memory per source byte (default "
+         + ", ".join(f"{factor:g} for {source_format}" for source_format, factor in MEMORY_FACTORS.items())
+         + ")",
+    type=float)
+@click.option(
+    "--batch-files",
+    "batch_max_files",
+    help="import up to this number of source files into one project and split "
+         "the export per file (default 1, no batching)",
+    default=1,
+    type=int)
+@click.option(
+    "--batch-bytes",
+    "batch_max_bytes",
+    help="max total size of the source files of a batch in bytes",
+    type=int)
+@click.option(
+    "--shard-bytes",
+    help="split source files larger than this size in bytes into shards, processed "
+         "in parallel and merged afterwards (only with row-local mappings)",
+    type=int)
+@click.option(
+    "--force",
+    help="process all source files, also those unchanged since the last run",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--resume",
+    help="continue an interrupted run, projects it left applied are exported "
+         "instead of processed again",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--engine",
+    help="execution engine, worker processes, coroutines or a pipeline of stages "
+         "in a single process (default pool)",
+    type=click.Choice(["pool", "asyncio", "pipeline"]),
+    default="pool")
+@click.option(
+    "--create-workers",
+    help="number of parallel creates (pipeline engine only, default max workers)",
+    type=int)
+@click.option(
+    "--apply-workers",
+    help="number of parallel applies (pipeline engine only, default max workers)",
+    type=int)
+@click.option(
+    "--export-workers",
+    help="number of parallel exports (pipeline engine only, default max workers)",
+    type=int)
+@click.option(
+    "--delete-workers",
+    help="number of parallel deletes (pipeline engine only, default max workers)",
+    type=int)
+@click.option(
+    "--async-timeout",
+    help="max seconds to wait for async processes per project (default 3600, 0 means no limit)",
+    default=3600,
+    type=float)
+@click.option(
+    "--retries",
+    help="number of retries of a stage failed with a transient error (default 3)",
+    default=RETRIES,
+    type=int)
+@click.option(
+    "--retry-backoff",
+    help="seconds to wait before the first retry, doubled for each further retry (default 1)",
+    default=RETRY_BACKOFF,
+    type=float)
+@click.option(
+    "--failed-files",
+    help="report of the failed source files as json lines (default "
+         f"{FAILED_FILES} in the export dir)",
+    type=str)
+@click.option(
+    "--profile",
+    help="apply the operations of the mappings one group at a time and report "
+         "the seconds per operation, slowest first",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--profile-group-size",
+    help="number of operations applied at once with --profile (default 1)",
+    default=1,
+    type=click.IntRange(min=1))
+@click.option(
+    "--profile-file",
+    help="ranked seconds per operation group with --profile as json lines",
+    type=str)
+@click.option(
+    "--gc-age",
+    help="before and after the run delete projects of openrefine-wrench runs older "
+         "than this number of seconds, after the run also those left by the run "
+         "itself (projects kept to resume a run are never deleted)",
+    type=float)
+@click.option(
+    "--metrics-file",
+    help="per job stage durations and bytes sent and received as json lines",
+    type=str)
+@click.option(
+    "--prometheus-file",
+    help="run metrics for the prometheus node exporter textfile collector",
+    type=str)
+@click.option(
+    "--pool-maxsize",
+    help="number of keep-alive connections per worker (default 4)",
+    default=4,
+    type=int)
+@click.option(
+    "--connect-timeout",
+    help="seconds to connect to openrefine, a timed out request is retried (default 10)",
+    default=DEFAULT_REQUEST_TIMEOUT[0],
+    type=click.FloatRange(min=0, min_open=True))
+@click.option(
+    "--request-timeout",
+    help="seconds to wait for data of an openrefine request, a timed out "
+         "request is retried (default 900)",
+    default=DEFAULT_REQUEST_TIMEOUT[1],
+    type=click.FloatRange(min=0, min_open=True))
 @click.option(
     "--log-level",
     help="log level (default INFO)",
@@ -225,14 +1244,57 @@ def _run_or_processing(
 def openrefine_wrench(
     host,
     port,
+    backend,
+    backends_file,
     source_dir,
+    recursive,
+    source_list,
+    include,
+    exclude,
+    min_size,
+    max_size,
+    sort_window,
     export_dir,
     source_format,
     encoding,
     record_path,
     columns_separator,
+    compress_upload,
     mappings_file,
+    routes_file,
+    export_formats,
+    export_templates,
+    output_file,
+    output_max_bytes,
+    output_source_column,
     max_workers,
+    auto_min_workers,
+    auto_max_workers,
+    server_memory_budget,
+    memory_factor,
+    batch_max_files,
+    batch_max_bytes,
+    shard_bytes,
+    force,
+    resume,
+    engine,
+    create_workers,
+    apply_workers,
+    export_workers,
+    delete_workers,
+    async_timeout,
+    retries,
+    retry_backoff,
+    failed_files,
+    profile,
+    profile_group_size,
+    profile_file,
+    gc_age,
+    metrics_file,
+    prometheus_file,
+    pool_maxsize,
+    connect_timeout,
+    request_timeout,
     log_level,
     custom_options,
     logfile):
@@ -241,6 +1303,51 @@ def openrefine_wrench(
     global logger
     logger = _prep_logger(log_level, logfile)
 
+    set_request_timeout((connect_timeout, request_timeout))
+
+    backends = [parse_backend(backend, port) for backend in backend]
+    if backends_file is not None:
+        backends.extend(read_backends_file(backends_file, port))
+
+    if host is None and not backends:
+        raise click.UsageError("either --host or --backend/--backends-file is required")
+
+    if source_dir is None and source_list is None and routes_file is None:
+        raise click.UsageError("either --source-dir, --source-list or --routes-file is required")
+
+    if mappings_file is None and routes_file is None:
+        raise click.UsageError("either --mappings-file or --routes-file is required")
+
+    concurrency = None
+    if max_workers == "auto":
+        concurrency = AdaptiveConcurrency(auto_min_workers, auto_max_workers)
+        max_workers = concurrency.max_workers
+    elif max_workers.isdigit() and int(max_workers) > 0:
+        max_workers = int(max_workers)
+    else:
+        raise click.BadParameter(
+            "must be a positive number or auto", param_hint="--max-workers")
+
+    global _backends
+    servers = [(host, port)]
+    if backends:
+        if host is not None:
+            backends.insert(0, (host, port))
+        servers = backends
+        _backends = BackendPool(
+            backends, shared=(engine == "pool"), memory_budget=server_memory_budget)
+        _backends.check_all()
+        host = port = None
+
+    memory_budget = None
+    if server_memory_budget is not None:
+        # with several backends the budget of each one is kept by the
+        # placement of the jobs on them
+        memory_budget = MemoryBudget(
+            server_memory_budget, place=_place_job if backends else None)
+        if memory_factor is None:
+            memory_factor = MEMORY_FACTORS[source_format]
+
     options = _prep_options(
         source_format,
         record_path,
@@ -248,21 +1355,288 @@ def openrefine_wrench(
         encoding,
         custom_options)
 
-    source_files = pathlib.Path(source_dir).glob(f"*.{source_format}")
+    exports = _prep_exports(export_formats, export_templates)
+    if exports and (batch_max_files > 1 or batch_max_bytes is not None or shard_bytes is not None):
+        raise click.UsageError(
+            "further export formats can't be split into batches or merged from shards")
+    if exports and output_file is not None:
+        raise click.UsageError("further export formats can't be written to the output file")
+    if output_file is None and (output_max_bytes is not None or output_source_column is not None):
+        raise click.UsageError(
+            "--output-max-bytes and --output-source-column require --output-file")
+    # the projects of all files are exported again if the exports change
+    hash_settings = {"exports": exports} if exports else {}
+
+    source_files = []
+    if source_list is not None:
+        source_files = read_source_list(source_list)
+    elif source_dir is not None:
+        source_files = discover_files(
+            source_dir, source_format, recursive=recursive, skip_dirs=[export_dir])
     or_project = None
 
-    with(open(file=mappings_file, mode="r", encoding="UTF-8")) as fi:
-        or_project = json.loads(fi.read())
+    def _export_path(source_file):
+        return export_file_path(source_file, export_dir, source_dir=source_dir)
 
-    _pool_handler(
+    if routes_file is not None:
+        router = Router(
+            routes_file, source_format, options, mappings_file, hash_settings=hash_settings)
+        source_files = _routed_files(
+            itertools.chain(source_files, router.source_files()), router)
+        manifest = Manifest(
+            export_dir,
+            mappings_hash=None,
+            options_hash=None,
+            hashes=router.hashes,
+            export_path=_export_path)
+        run_settings_hash = settings_hash({"routes": router.settings_hash})
+    else:
+        router = None
+        with(open(file=mappings_file, mode="r", encoding="UTF-8")) as fi:
+            or_project = json.loads(fi.read())
+        manifest = Manifest(
+            export_dir,
+            mappings_hash=file_hash(mappings_file),
+            options_hash=settings_hash(dict(
+                {"source_format": source_format, "options": options}, **hash_settings)),
+            export_path=_export_path)
+        run_settings_hash = settings_hash({
+            "mappings_hash": manifest.mappings_hash,
+            "options_hash": manifest.options_hash})
+
+    global _journal
+    _journal = Journal(export_dir, settings_hash=run_settings_hash)
+    unfinished = _journal.load()
+
+    if resume:
+        for job in unfinished.values():
+            if job["stage"] == "export" and _journal.unchanged(job):
+                for source_file, export_file in job["exports"]:
+                    manifest.record(source_file, export_file)
+        stale = [
+            key for key, job in unfinished.items()
+            if job["stage"] != "apply" or not job["same_settings"]]
+    else:
+        stale = list(unfinished)
+
+    if stale:
+        logger.info(f"clean up {len(stale)} projects left by an interrupted run")
+    carried = _cleanup_projects([unfinished.pop(key) for key in stale])
+    _journal.start(carried=carried + list(unfinished.values()))
+
+    run_id = uuid.uuid4().hex
+    logger.info(f"[pid {getpid()}] start run with id \"{run_id}\"")
+
+    if gc_age is not None:
+        _collect_garbage(
+            servers,
+            max_age=gc_age,
+            keep=[job["project_id"] for job in carried + list(unfinished.values())])
+
+    source_files = filter_files(
+        source_files,
+        include=include,
+        exclude=exclude,
+        min_size=min_size,
+        max_size=max_size,
+        base_dir=source_dir)
+
+    failed = []
+    # source lists and routes take files from anywhere in any order
+    source_files = _unique_exports(
+        source_files,
+        _export_path,
+        failed,
+        per_dir=source_list is None and routes_file is None)
+
+    # the output file has to hold the rows of all source files
+    source_files = manifest.changed_files(source_files, force=force or output_file is not None)
+
+    # the most costly files first, so that none of them is left for a single
+    # busy worker at the end of the run
+    source_files = _costly_first(source_files, manifest.estimate, window=sort_window)
+
+    sink = None
+    staging_dir = None
+    if output_file is not None:
+        sink = ExportSink(
+            output_file, max_bytes=output_max_bytes, source_column=output_source_column)
+        # the exports are staged until appended to the output file
+        staging_dir = tempfile.mkdtemp(prefix=".openrefine-wrench-output.", dir=export_dir)
+
+    settings = dict(
         host=host,
         port=port,
-        source_files=source_files,
-        export_dir=export_dir,
+        export_dir=staging_dir or export_dir,
+        source_dir=source_dir,
         options=options,
         or_project=or_project,
+        mappings_file=mappings_file,
+        exports=exports,
         source_format=source_format,
-        max_workers=max_workers)
+        async_timeout=async_timeout or None,
+        compress_upload=compress_upload,
+        retries=retries,
+        retry_backoff=retry_backoff,
+        run_id=run_id,
+        profile_group_size=profile_group_size if profile else None)
+
+    sharded = []
+    job_settings = dict(
+        sharded=sharded,
+        shard_bytes=shard_bytes,
+        batch_max_files=batch_max_files,
+        batch_max_bytes=batch_max_bytes)
+
+    if router is None:
+        shard_jobs, jobs = _prep_all_jobs(source_files, **job_settings, **settings)
+    else:
+        routed = _group_by_route(source_files, router)
+
+        route_jobs = [
+            _prep_all_jobs(
+                files,
+                **job_settings,
+                **dict(
+                    settings,
+                    or_project=route["or_project"],
+                    options=route["options"],
+                    mappings_file=route["mappings_file"]))
+            for route, files in routed]
+
+        shard_jobs = itertools.chain(*[shards for shards, _ in route_jobs])
+        # all routes share the workers, still the most costly files first
+        jobs = heapq.merge(
+            *[jobs for _, jobs in route_jobs],
+            key=lambda job: -manifest.estimate(job["project_file"]))
+
+    if resume:
+        jobs = _resume_jobs(jobs, _journal)
+
+    metrics = RunMetrics(metrics_file)
+    operation_profiles = {}
+
+    def _on_done(job):
+        record = _job_record(job)
+        # the gates are released first, no job must wait for them if the
+        # rest fails and the run is aborted
+        if memory_budget is not None:
+            memory_budget.done(job)
+        if concurrency is not None:
+            concurrency.done(
+                record["seconds"],
+                sum(
+                    os.path.getsize(file) for file in record["source_files"]
+                    if os.path.exists(file)),
+                failed="error" in job,
+                retried=bool(record["retries"]))
+        metrics.add(record)
+        if job.get("operation_seconds") is not None:
+            if job["mappings_file"] not in operation_profiles:
+                operation_profiles[job["mappings_file"]] = OperationProfile(
+                    job["or_project"], profile_group_size, mappings_file=job["mappings_file"])
+            operation_profiles[job["mappings_file"]].add(job["operation_seconds"])
+        if "error" in job:
+            failed.append(job)
+            return
+        exports = _job_exports(job)
+        sizes = [os.path.getsize(source_file) for source_file, _ in exports]
+        for (source_file, export_file), size in zip(exports, sizes):
+            # batch processing time is shared by size, resumed jobs are not timed
+            seconds = None
+            if "resume_at" not in job:
+                seconds = (
+                    sum(job.get("stage_seconds", {}).values()) * size / max(1, sum(sizes)))
+            # hashed by the worker while uploading, not here one after another
+            manifest.record(
+                source_file,
+                export_file,
+                seconds=seconds,
+                content_hash=job.get("content_hashes", {}).get(str(source_file)))
+        if sink is not None:
+            try:
+                _sink_exports(sink, exports)
+            except ValueError as exc:
+                job["error"] = {"stage": "output", "type": type(exc).__name__, "message": str(exc)}
+                logger.error(f"[pid {getpid()}] output failed for {_describe(job)}, error was:\n{exc}")
+                failed.append(job)
+
+    def _on_merged(source_file, export_file):
+        manifest.record(source_file, export_file)
+        if sink is not None:
+            _sink_exports(sink, [(source_file, export_file)])
+
+    jobs = itertools.chain(shard_jobs, jobs)
+    # admitted by memory first, a job waiting for memory must not hold a
+    # slot of the adaptive concurrency
+    if memory_budget is not None:
+        jobs = memory_budget.gate(
+            jobs,
+            estimate=lambda job: memory_factor * sum(
+                os.path.getsize(file) for file in job.get("batch") or [job["project_file"]]))
+    if concurrency is not None:
+        jobs = concurrency.gate(jobs)
+
+    try:
+        HANDLERS[engine](
+            jobs,
+            max_workers=max_workers,
+            pool_maxsize=pool_maxsize,
+            stage_workers={
+                "create": create_workers,
+                "apply": apply_workers,
+                "export": export_workers,
+                "delete": delete_workers},
+            on_done=_on_done)
+
+        _merge_shards(
+            sharded,
+            on_merged=_on_merged,
+            failed={source_file for job in failed for source_file in _job_sources(job)})
+
+        # applied projects of the interrupted run not taken over by this run,
+        # the journal is kept for projects left on openrefine
+        left = _cleanup_projects(_journal.unfinished.values())
+        left.extend(job for job in failed if "project_id" in job)
+        if not left:
+            _journal.remove()
+
+        if gc_age is not None:
+            _collect_garbage(
+                servers,
+                max_age=gc_age,
+                run_id=run_id,
+                keep=[job["project_id"] for job in left])
+
+        if sink is not None:
+            sink.close()
+    except BaseException:
+        if sink is not None:
+            sink.abort()
+        raise
+    finally:
+        manifest.save()
+
+        metrics.close()
+        metrics.log_summary()
+        for number, operation_profile in enumerate(operation_profiles.values()):
+            _log_profile(operation_profile, profile_file, mode="a" if number else "w")
+        if prometheus_file is not None:
+            metrics.write_prometheus(prometheus_file)
+
+        for _, shard_dir, _, _ in sharded:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    failed_files = failed_files or str(pathlib.Path(export_dir) / FAILED_FILES)
+
+    if failed:
+        reported = _write_failed_files(failed_files, failed)
+        logger.error(f"{len(reported)} source files failed, listed in {failed_files}")
+        raise SystemExit(1)
+    elif os.path.exists(failed_files):
+        os.remove(failed_files)
 
 @click.command()
 @click.option(
@@ -304,6 +1678,11 @@ def openrefine_wrench(
     help="columns separator (only applicable in conjunction with csv source format)",
     type=str,
     default=",")
+@click.option(
+    "--compress-upload",
+    help="gzip compress the source data on the fly while uploading",
+    is_flag=True,
+    default=False)
 @click.option(
     "--log-level",
     help="log level (default INFO)",
@@ -326,6 +1705,7 @@ def openrefine_wrench_create(
     encoding,
     record_path,
     columns_separator,
+    compress_upload,
     log_level,
     custom_options,
     logfile):
@@ -350,7 +1730,8 @@ def openrefine_wrench_create(
         project_file=source_file,
         project_name=project_name,
         source_format=source_format,
-        options=options)
+        options=options,
+        compress=compress_upload)
 
 @click.command()
 @click.option(
@@ -371,6 +1752,26 @@ def openrefine_wrench_create(
     "--mappings-file",
     help="openrefine mappings file",
     required=True)
+@click.option(
+    "--async-timeout",
+    help="max seconds to wait for async processes per project (default 3600, 0 means no limit)",
+    default=3600,
+    type=float)
+@click.option(
+    "--profile",
+    help="apply the operations of the mappings one group at a time and report "
+         "the seconds per operation, slowest first",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--profile-group-size",
+    help="number of operations applied at once with --profile (default 1)",
+    default=1,
+    type=click.IntRange(min=1))
+@click.option(
+    "--profile-file",
+    help="ranked seconds per operation group with --profile as json lines",
+    type=str)
 @click.option(
     "--log-level",
     help="log level (default INFO)",
@@ -385,6 +1786,10 @@ def openrefine_wrench_apply(
     port,
     project_id,
     mappings_file,
+    async_timeout,
+    profile,
+    profile_group_size,
+    profile_file,
     log_level,
     logfile):
     """Apply rules to single openrefine project."""
@@ -398,12 +1803,32 @@ def openrefine_wrench_apply(
     with(open(file=mappings_file, mode="r", encoding="UTF-8")) as fi:
         or_project = json.loads(fi.read())
 
-    apply_or_project(
+    if not profile:
+        apply_or_project(
+            host=host,
+            port=port,
+            pid=pid,
+            project_id=project_id,
+            or_project=or_project,
+            async_timeout=async_timeout or None)
+        return
+
+    operation_seconds = profile_apply(
         host=host,
         port=port,
         pid=pid,
         project_id=project_id,
-        or_project=or_project)
+        or_project=or_project,
+        group_size=profile_group_size,
+        async_timeout=async_timeout or None)
+
+    if operation_seconds is None:
+        raise SystemExit(1)
+
+    operation_profile = OperationProfile(
+        or_project, profile_group_size, mappings_file=mappings_file)
+    operation_profile.add(operation_seconds)
+    _log_profile(operation_profile, profile_file)
 
 @click.command()
 @click.option(
@@ -500,3 +1925,253 @@ def openrefine_wrench_delete(
         port=port,
         pid=pid,
         project_id=project_id)
+
+@click.command()
+@click.option(
+    "--host",
+    help="openrefine host",
+    required=True)
+@click.option(
+    "--port",
+    help="openrefine port (default to 3333)",
+    default="3333",
+    type=str,
+    required=True)
+@click.option(
+    "--older-than",
+    help="delete projects of openrefine-wrench runs created more than this number "
+         "of seconds ago",
+    type=float)
+@click.option(
+    "--run-id",
+    help="delete the projects of the openrefine-wrench run with this id (logged at "
+         "the start of the run)",
+    type=str)
+@click.option(
+    "--untagged",
+    help="also delete untagged projects named like those of openrefine-wrench runs "
+         "(\"<stem>_<uuid4>\", created by older versions)",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--max-workers",
+    help="number of parallel deletes (default 4)",
+    default=4,
+    type=int)
+@click.option(
+    "--dry-run",
+    help="only log the projects which would be deleted",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--log-level",
+    help="log level (default INFO)",
+    type=click.Choice(["DEBUG", "INFO", "WARN", "ERROR", "OFF"]), default="INFO")
+@click.option(
+    "--logfile",
+    help="openrefine-wrench-gc related logfile",
+    default=None,
+    type=str)
+def openrefine_wrench_gc(
+    host,
+    port,
+    older_than,
+    run_id,
+    untagged,
+    max_workers,
+    dry_run,
+    log_level,
+    logfile):
+    """Delete projects left on openrefine by openrefine-wrench runs."""
+
+    global logger
+    logger = _prep_logger(log_level, logfile)
+
+    if older_than is None and run_id is None:
+        raise click.UsageError("either --older-than or --run-id is required")
+
+    _, failed = collect_projects(
+        host=host,
+        port=port,
+        pid=getpid(),
+        max_age=older_than,
+        run_id=run_id,
+        untagged=untagged,
+        max_workers=max_workers,
+        dry_run=dry_run)
+
+    if failed:
+        raise SystemExit(1)
+
+@click.command()
+@click.option(
+    "--host",
+    help="openrefine host to benchmark (default to a local stand-in server)")
+@click.option(
+    "--port",
+    help="openrefine port (default to 3333)",
+    default="3333",
+    type=str)
+@click.option(
+    "--files",
+    help="number of generated source files (default 50)",
+    default=50,
+    type=int)
+@click.option(
+    "--rows",
+    help="median number of rows of the generated source files (default 1000)",
+    default=1000,
+    type=int)
+@click.option(
+    "--engine",
+    help="execution engine to benchmark, repeat for several (default all)",
+    type=click.Choice(list(HANDLERS)),
+    multiple=True)
+@click.option(
+    "--max-workers",
+    help="number of parallel processed projects (or auto) to benchmark, repeat for "
+         "several (default 1, 2, 4 and 8)",
+    type=str,
+    multiple=True)
+@click.option(
+    "--latency",
+    help="seconds the stand-in delays every post request (default 0.01)",
+    default=0.01,
+    type=float)
+@click.option(
+    "--async-duration",
+    help="seconds the stand-in runs the operations as async process (default 0, no async processes)",
+    default=0.0,
+    type=float)
+@click.option(
+    "--error-rate",
+    help="share of stand-in post requests answered with a server error (default 0)",
+    default=0.0,
+    type=float)
+@click.option(
+    "--export-factor",
+    help="number of times the stand-in repeats the rows in exports (default 1)",
+    default=1,
+    type=int)
+@click.option(
+    "--capacity",
+    help="number of projects the stand-in holds without slowing down (default no limit)",
+    type=int)
+@click.option(
+    "--work-dir",
+    help="directory for the generated source files and the exports "
+         "(default a temporary directory)",
+    type=str)
+@click.option(
+    "--report-file",
+    help="benchmark results as json",
+    type=str)
+@click.option(
+    "--log-level",
+    help="log level (default INFO)",
+    type=click.Choice(["DEBUG", "INFO", "WARN", "ERROR", "OFF"]), default="INFO")
+@click.option(
+    "--logfile",
+    help="openrefine-wrench-benchmark related logfile",
+    default=None,
+    type=str)
+def openrefine_wrench_benchmark(
+    host,
+    port,
+    files,
+    rows,
+    engine,
+    max_workers,
+    latency,
+    async_duration,
+    error_rate,
+    export_factor,
+    capacity,
+    work_dir,
+    report_file,
+    log_level,
+    logfile):
+    """Benchmark openrefine-wrench over generated source files."""
+
+    global logger
+    logger = _prep_logger(log_level, logfile)
+
+    server = None
+    if host is None:
+        server = standin.serve(
+            latency=latency,
+            async_duration=async_duration,
+            error_rate=error_rate,
+            export_factor=export_factor,
+            capacity=capacity)
+        host, port = server.server_address[0], str(server.server_address[1])
+
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix="openrefine-wrench-benchmark.")
+
+    results = []
+
+    try:
+        source_dir = f"{work_dir}/source"
+        source_bytes = generate_dataset(source_dir, files, rows)
+
+        mappings_file = f"{work_dir}/mappings.json"
+        with(open(file=mappings_file, mode="w", encoding="UTF-8")) as fo:
+            json.dump(BENCHMARK_MAPPINGS, fo)
+
+        for run_engine in engine or list(HANDLERS):
+            for run_max_workers in max_workers or ("1", "2", "4", "8"):
+                export_dir = f"{work_dir}/export-{run_engine}-{run_max_workers}"
+                shutil.rmtree(export_dir, ignore_errors=True)
+                os.makedirs(export_dir)
+
+                logger.info(
+                    f"benchmark {run_engine} engine with {run_max_workers} max workers")
+
+                started = monotonic()
+                try:
+                    openrefine_wrench.main(
+                        args=[
+                            "--host", host,
+                            "--port", port,
+                            "--source-dir", source_dir,
+                            "--export-dir", export_dir,
+                            "--source-format", "csv",
+                            "--mappings-file", mappings_file,
+                            "--max-workers", run_max_workers,
+                            "--engine", run_engine,
+                            "--log-level", log_level,
+                            "--logfile", f"{export_dir}/openrefine-wrench.log"],
+                        standalone_mode=False)
+                except SystemExit:
+                    pass
+                seconds = monotonic() - started
+
+                # the benchmarked run logs into its export dir
+                logger = _prep_logger(log_level, logfile, mode="a")
+
+                failed = 0
+                if os.path.exists(f"{export_dir}/{FAILED_FILES}"):
+                    with(open(file=f"{export_dir}/{FAILED_FILES}", mode="r", encoding="UTF-8")) as fi:
+                        failed = sum(1 for _ in fi)
+
+                results.append({
+                    "engine": run_engine,
+                    "max_workers": int(run_max_workers) if run_max_workers.isdigit() else run_max_workers,
+                    "files": files,
+                    "failed": failed,
+                    "seconds": seconds,
+                    "files_per_second": files / seconds,
+                    "mb_per_second": source_bytes / 1e6 / seconds})
+    finally:
+        if server is not None:
+            server.shutdown()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    click.echo(format_report(results))
+
+    if report_file is not None:
+        with(open(file=report_file, mode="w", encoding="UTF-8")) as fo:
+            json.dump(results, fo, indent=1)
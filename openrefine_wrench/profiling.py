@@ -0,0 +1,117 @@
+import json
+import logging
+from time import monotonic
+
+from openrefine_wrench.openrefine_api_calls import apply_or_project
+
+logger = logging.getLogger(__name__)
+
+def _describe_operation(operation):
+    column = (
+        operation.get("columnName")
+        or operation.get("baseColumnName")
+        or operation.get("newColumnName"))
+    description = operation.get("description") or operation.get("op", "")
+
+    return f"[{column}] {description}" if column else description
+
+def profile_apply(
+    host,
+    port,
+    pid,
+    project_id,
+    or_project,
+    group_size=1,
+    client=None,
+    async_timeout=None,
+    stats=None):
+    """Apply the rules to an openrefine project in groups of group_size
+    operations, each group waits for its async processes before the next
+    one is applied.
+
+    Returns:
+        seconds:        wall time per group, None if openrefine rejected a group
+    """
+    seconds = []
+
+    for start in range(0, len(or_project), group_size):
+        started = monotonic()
+        if not apply_or_project(
+            host=host,
+            port=port,
+            pid=pid,
+            project_id=project_id,
+            or_project=or_project[start:start + group_size],
+            client=client,
+            async_timeout=async_timeout,
+            stats=stats):
+            return None
+        seconds.append(monotonic() - started)
+
+    return seconds
+
+class OperationProfile:
+    """Wall time per operation group of the rules, summed over projects.
+
+    Args:
+        or_project:     the applied rules
+        group_size:     number of operations applied at once
+        mappings_file:  optional mappings file of the rules, added to the
+                        records
+    """
+
+    def __init__(self, or_project, group_size=1, mappings_file=None):
+        self.mappings_file = mappings_file
+        self.groups = [
+            or_project[start:start + group_size]
+            for start in range(0, len(or_project), group_size)]
+        self.group_size = group_size
+        self.seconds = [0.0] * len(self.groups)
+        self.projects = 0
+
+    def add(self, seconds):
+        """add the seconds per group of one project"""
+        self.seconds = [total + group for total, group in zip(self.seconds, seconds)]
+        self.projects += 1
+
+    def records(self):
+        """groups ranked by their seconds, slowest first"""
+        total = sum(self.seconds)
+        ranked = sorted(range(len(self.groups)), key=lambda index: -self.seconds[index])
+
+        return [{
+            "rank": rank,
+            "operations": [
+                index * self.group_size + offset + 1
+                for offset in range(len(self.groups[index]))],
+            "seconds": self.seconds[index],
+            "mean_seconds": self.seconds[index] / max(1, self.projects),
+            "share": self.seconds[index] / total if total else 0.0,
+            "descriptions": [
+                _describe_operation(operation) for operation in self.groups[index]],
+            "mappings_file": self.mappings_file}
+            for rank, index in enumerate(ranked, start=1)]
+
+    def format_report(self):
+        """ranked groups as text table, one line per operation"""
+        lines = [
+            f"{'rank':>5}{'seconds':>10}{'mean':>9}{'share':>8}{'op':>6}  operation"]
+
+        for record in self.records():
+            for number, (operation, description) in enumerate(
+                zip(record["operations"], record["descriptions"])):
+                if number == 0:
+                    lines.append(
+                        f"{record['rank']:>5}{record['seconds']:>10.3f}"
+                        f"{record['mean_seconds']:>9.3f}{record['share']:>8.1%}"
+                        f"{operation:>6}  {description}")
+                else:
+                    lines.append(f"{'':>32}{operation:>6}  {description}")
+
+        return "\n".join(lines)
+
+    def write(self, profile_file, mode="w"):
+        """write the ranked groups as json lines"""
+        with(open(file=profile_file, mode=mode, encoding="UTF-8")) as fo:
+            for record in self.records():
+                fo.write(json.dumps(record) + "\n")
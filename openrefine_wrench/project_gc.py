@@ -0,0 +1,140 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from openrefine_wrench.openrefine_api_calls import delete_or_project, get_or_projects_metadata
+
+logger = logging.getLogger(__name__)
+
+# tag of all projects created by openrefine-wrench runs, the run tag is the
+# prefix followed by the run id
+WRENCH_TAG = "openrefine-wrench"
+RUN_TAG_PREFIX = "openrefine-wrench-run-"
+
+# fractional seconds, parsed by datetime (before python 3.11) with exactly
+# three or six digits only
+_FRACTION = re.compile(r"\.(\d+)")
+
+# "<stem>_<uuid4>" project names of openrefine-wrench runs before tagging
+_UNTAGGED_NAME = re.compile(
+    r"_[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$")
+
+def project_tags(run_id):
+    """tags stamped on the projects of a run"""
+    return [WRENCH_TAG, RUN_TAG_PREFIX + run_id]
+
+def _created(metadata):
+    """creation time of a project as aware datetime, times without offset
+    are utc, None if it can't be parsed"""
+    value = str(metadata.get("created") or "").strip()
+    value = _FRACTION.sub(
+        lambda match: "." + match.group(1).ljust(6, "0")[:6],
+        value.replace("Z", "+00:00").replace("z", "+00:00"))
+
+    try:
+        created = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+
+    return created
+
+def select_projects(
+    projects,
+    max_age=None,
+    run_id=None,
+    untagged=False,
+    keep=(),
+    now=None):
+    """Select the openrefine-wrench projects to delete.
+
+    Args:
+        projects:       project id to metadata of all openrefine projects
+        max_age:        select projects created more than max_age seconds ago
+        run_id:         select the projects of this run
+        untagged:       also consider untagged projects named like those of
+                        openrefine-wrench runs
+        keep:           ids of projects never selected
+        now:            current time, defaults to now
+
+    Returns:
+        project_ids:    ids of the selected projects
+    """
+    now = now or datetime.now(timezone.utc)
+    keep = {str(project_id) for project_id in keep}
+    selected = []
+
+    for project_id, metadata in projects.items():
+        tags = metadata.get("tags") or []
+
+        if project_id in keep:
+            continue
+        if WRENCH_TAG not in tags and not (
+            untagged and _UNTAGGED_NAME.search(metadata.get("name") or "")):
+            continue
+
+        if run_id is not None and RUN_TAG_PREFIX + run_id in tags:
+            selected.append(project_id)
+        elif max_age is not None:
+            created = _created(metadata)
+            if created is None:
+                logger.warning(
+                    f"project with id \"{project_id}\" not selected by its age, "
+                    f"creation time \"{metadata.get('created')}\" can't be parsed")
+            elif (now - created).total_seconds() > max_age:
+                selected.append(project_id)
+
+    return selected
+
+def collect_projects(
+    host,
+    port,
+    pid,
+    max_age=None,
+    run_id=None,
+    untagged=False,
+    keep=(),
+    max_workers=4,
+    dry_run=False):
+    """Delete the openrefine-wrench projects selected by select_projects,
+    max_workers at a time.
+
+    Returns:
+        deleted:        ids of the deleted (or with dry_run selected) projects
+        failed:         ids of the projects which couldn't be deleted
+    """
+    project_ids = select_projects(
+        get_or_projects_metadata(host, port, pid),
+        max_age=max_age,
+        run_id=run_id,
+        untagged=untagged,
+        keep=keep)
+
+    if dry_run:
+        for project_id in project_ids:
+            logger.info(f"[pid {pid}] would delete or project with id \"{project_id}\"")
+        return project_ids, []
+
+    def _delete(project_id):
+        try:
+            delete_or_project(host=host, port=port, pid=pid, project_id=project_id)
+        except (requests.exceptions.RequestException, ValueError):
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(_delete, project_ids))
+
+    deleted = [project_id for project_id, ok in zip(project_ids, results) if ok]
+    failed = [project_id for project_id, ok in zip(project_ids, results) if not ok]
+
+    logger.info(
+        f"[pid {pid}] garbage collected {len(deleted)} or projects on {host}:{port}"
+        + (f", {len(failed)} couldn't be deleted" if failed else ""))
+
+    return deleted, failed
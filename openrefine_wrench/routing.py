@@ -0,0 +1,129 @@
+import fnmatch
+import json
+import logging
+import pathlib
+import re
+from openrefine_wrench.discovery import discover_files
+from openrefine_wrench.manifest import file_hash, settings_hash
+
+logger = logging.getLogger(__name__)
+
+class Router:
+    """Routing of source files to mappings files and import options.
+
+    The routes file is a json list of routes, tried in order for each
+    source file. A route matches the files below its source_dir (if given)
+    whose name or path matches its glob pattern and regex (if given), the
+    first matching route applies its mappings_file and its options on top
+    of the import options of the run. Files matched by no route use the
+    default mappings file, or are skipped without one. Relative paths are
+    resolved against the directory of the routes file, each mappings file
+    is read once and shared by all routes using it.
+
+        [{"name": "feed_a", "pattern": "feed_a_*.csv", "mappings_file": "a.json"},
+         {"source_dir": "feed_b", "mappings_file": "b.json",
+          "options": {"separator": ";"}}]
+
+    Args:
+        routes_file:    json file of the routes
+        source_format:  format of the source data
+        options:        import options of the run
+        mappings_file:  optional default mappings file
+        hash_settings:  optional further settings of the run hashed along
+                        with the import options
+    """
+
+    def __init__(
+        self,
+        routes_file,
+        source_format,
+        options,
+        mappings_file=None,
+        hash_settings=None):
+        self.source_format = source_format
+        self.hash_settings = hash_settings or {}
+        self._mappings = {}
+
+        base_dir = pathlib.Path(routes_file).parent
+        with(open(file=routes_file, mode="r", encoding="UTF-8")) as fi:
+            routes = json.load(fi)
+
+        self.routes = []
+        for number, route in enumerate(routes, start=1):
+            if "mappings_file" not in route:
+                raise ValueError(f"route {number} of {routes_file} has no mappings_file")
+            source_dir = route.get("source_dir")
+            self.routes.append(self._route(
+                name=route.get("name") or f"route {number}",
+                mappings_file=base_dir / route["mappings_file"],
+                options=dict(options, **route.get("options", {})),
+                source_dir=str(base_dir / source_dir) if source_dir is not None else None,
+                pattern=route.get("pattern"),
+                regex=re.compile(route["regex"]) if route.get("regex") else None))
+
+        self.default = None
+        if mappings_file is not None:
+            self.default = self._route(
+                name="default", mappings_file=mappings_file, options=options)
+
+        self.settings_hash = settings_hash([
+            [route["name"], route["mappings_hash"], route["options_hash"]]
+            for route in self.routes + [self.default] if route is not None])
+
+    def _route(self, name, mappings_file, options, source_dir=None, pattern=None, regex=None):
+        key = str(pathlib.Path(mappings_file).resolve())
+        if key not in self._mappings:
+            with(open(file=mappings_file, mode="r", encoding="UTF-8")) as fi:
+                self._mappings[key] = (json.loads(fi.read()), file_hash(mappings_file))
+        or_project, mappings_hash = self._mappings[key]
+
+        return {
+            "name": name,
+            "mappings_file": str(mappings_file),
+            "or_project": or_project,
+            "options": options,
+            "source_dir": source_dir,
+            "pattern": pattern,
+            "regex": regex,
+            "mappings_hash": mappings_hash,
+            "options_hash": settings_hash(dict(
+                {"source_format": self.source_format, "options": options},
+                **self.hash_settings))}
+
+    def source_files(self):
+        """source files of the routes with a source dir, compressed files
+        and archives included"""
+        for route in self.routes:
+            if route["source_dir"] is not None:
+                yield from discover_files(route["source_dir"], self.source_format)
+
+    def route(self, source_file):
+        """the route of a source file, None if it is skipped"""
+        path = pathlib.Path(source_file)
+
+        for route in self.routes:
+            if route["source_dir"] is not None:
+                try:
+                    relative = path.resolve().relative_to(
+                        pathlib.Path(route["source_dir"]).resolve())
+                except ValueError:
+                    continue
+            else:
+                relative = path
+            if route["pattern"] is not None and not (
+                fnmatch.fnmatch(path.name, route["pattern"])
+                or fnmatch.fnmatch(str(relative), route["pattern"])):
+                continue
+            if route["regex"] is not None and not route["regex"].search(str(relative)):
+                continue
+            return route
+
+        return self.default
+
+    def hashes(self, source_file):
+        """mappings and options hash of the route of a source file"""
+        route = self.route(source_file)
+        if route is None:
+            return None, None
+
+        return route["mappings_hash"], route["options_hash"]
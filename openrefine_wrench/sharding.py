@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+from openrefine_wrench.compression import open_source, strip_compression
+from openrefine_wrench.openrefine_api_calls import FILE_MODE
+
+logger = logging.getLogger(__name__)
+
+# operations depending on other rows than the one they are applied to
+NON_ROW_LOCAL_OPERATIONS = {
+    "core/blank-down",
+    "core/denormalize",
+    "core/fill-down",
+    "core/key-value-columnize",
+    "core/multivalued-cell-join",
+    "core/row-flag",
+    "core/row-reorder",
+    "core/row-star",
+    "core/transpose-rows-into-columns"}
+
+# grel functions and variables depending on other rows or the row position
+NON_ROW_LOCAL_EXPRESSIONS = (
+    "facetCount(",
+    "cross(",
+    "rowIndex",
+    "row.index",
+    "record.index",
+    "record.fromRowIndex",
+    "record.toRowIndex")
+
+def non_row_local_operations(or_project):
+    """descriptions of all operations which need the whole dataset, so
+    the source data can't be split into independently processed shards,
+    operations in record mode depend on the other rows of their records"""
+    operations = []
+
+    for operation in or_project:
+        operation_dump = json.dumps(operation)
+        if (operation.get("op") in NON_ROW_LOCAL_OPERATIONS
+            or (operation.get("engineConfig") or {}).get("mode") == "record-based"
+            or any(expression in operation_dump for expression in NON_ROW_LOCAL_EXPRESSIONS)):
+            operations.append(operation.get("description") or operation.get("op"))
+
+    return operations
+
+def csv_rows(fi):
+    """rows of a csv file as raw text, quoted line breaks are kept inside
+    their row"""
+    row = []
+    in_quotes = False
+
+    for line in fi:
+        row.append(line)
+        if line.count("\"") % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            yield "".join(row)
+            row = []
+
+    if row:
+        yield "".join(row)
+
+class _ShardWriter:
+    """write shards of about shard_bytes, each starting with head and
+    ending with tail"""
+
+    def __init__(self, source_file, shard_dir, shard_bytes, encoding, head="", tail=""):
+        self.source_path = pathlib.Path(strip_compression(source_file))
+        self.shard_dir = shard_dir
+        self.shard_bytes = shard_bytes
+        self.encoding = encoding
+        self.head = head
+        self.tail = tail
+        self.shards = []
+        self._fo = None
+        self._size = 0
+
+    def write(self, data):
+        if self._fo is None or self._size >= self.shard_bytes:
+            self._next_shard()
+        self._fo.write(data)
+        self._size += len(data)
+
+    def _next_shard(self):
+        self.close()
+        shard_file = (
+            f"{self.shard_dir}/{self.source_path.stem}.{len(self.shards):05d}"
+            f"{self.source_path.suffix}")
+        self._fo = open(shard_file, mode="w", encoding=self.encoding, newline="")
+        self._fo.write(self.head)
+        self._size = 0
+        self.shards.append(shard_file)
+
+    def close(self):
+        if self._fo is not None:
+            self._fo.write(self.tail)
+            self._fo.close()
+            self._fo = None
+
+def shard_csv(source_file, shard_dir, shard_bytes, encoding="UTF-8"):
+    """Split a csv file at row boundaries into shards of about shard_bytes,
+    the header row is repeated in each shard.
+
+    Returns:
+        shards:         list of shard files in source order
+    """
+    with open_source(source_file, mode="r", encoding=encoding, newline="") as fi:
+        rows = csv_rows(fi)
+        writer = _ShardWriter(
+            source_file, shard_dir, shard_bytes, encoding, head=next(rows, ""))
+        try:
+            for row in rows:
+                writer.write(row)
+        finally:
+            writer.close()
+
+    return writer.shards
+
+def _local_name(name):
+    return name.rsplit("}", 1)[-1].rsplit(":", 1)[-1]
+
+def shard_xml(source_file, shard_dir, shard_bytes, record_path, encoding="UTF-8"):
+    """Split a xml file into shards of about shard_bytes by streaming over
+    the records found under record_path (element names from the root to
+    the record element), each shard wraps its records in the elements
+    of the record path.
+
+    Returns:
+        shards:         list of shard files in source order
+    """
+    record_path = [_local_name(name) for name in record_path]
+    namespaces = {}
+    elements = []
+    writer = None
+
+    def _qualified_name(tag):
+        if tag.startswith("{"):
+            uri, local = tag[1:].split("}", 1)
+            prefix = namespaces.get(uri)
+            return f"{prefix}:{local}" if prefix else local
+        return tag
+
+    def _wrapper():
+        declarations = "".join(
+            f" xmlns:{prefix}={quoteattr(uri)}" if prefix else f" xmlns={quoteattr(uri)}"
+            for uri, prefix in namespaces.items())
+        head, tail = [f"<?xml version=\"1.0\" encoding=\"{encoding}\"?>\n"], []
+        for depth, element in enumerate(elements[:-1]):
+            attributes = "".join(
+                f" {_qualified_name(key)}={quoteattr(value)}"
+                for key, value in element.attrib.items())
+            head.append(
+                f"<{_qualified_name(element.tag)}"
+                f"{declarations if depth == 0 else ''}{attributes}>\n")
+            tail.insert(0, f"</{_qualified_name(element.tag)}>\n")
+        return "".join(head), "".join(tail)
+
+    fi = open_source(source_file, mode="rb")
+    try:
+        for event, item in ET.iterparse(fi, events=("start-ns", "start", "end")):
+            if event == "start-ns":
+                prefix, uri = item
+                namespaces.setdefault(uri, prefix)
+                try:
+                    ET.register_namespace(prefix, uri)
+                except ValueError:
+                    pass
+            elif event == "start":
+                elements.append(item)
+            else:
+                if [_local_name(element.tag) for element in elements] == record_path:
+                    if writer is None:
+                        head, tail = _wrapper()
+                        writer = _ShardWriter(
+                            source_file, shard_dir, shard_bytes, encoding, head=head, tail=tail)
+                    writer.write(ET.tostring(item, encoding="unicode"))
+                    if len(elements) > 1:
+                        elements[-2].remove(item)
+                elements.pop()
+    finally:
+        fi.close()
+        if writer is not None:
+            writer.close()
+
+    return writer.shards if writer is not None else []
+
+def shard_file(
+    source_file,
+    source_format,
+    shard_bytes,
+    work_dir,
+    record_path=None,
+    encoding="UTF-8"):
+    """Split a source file into shards in a temporary directory in work_dir.
+
+    Returns:
+        shard_dir:      temporary directory of the shards
+        shards:         list of shard files in source order
+    """
+    source_path = pathlib.Path(source_file)
+    shard_dir = tempfile.mkdtemp(prefix=f".{source_path.name}.shards.", dir=work_dir)
+
+    try:
+        if source_format == "xml":
+            shards = shard_xml(source_file, shard_dir, shard_bytes, record_path, encoding)
+        else:
+            shards = shard_csv(source_file, shard_dir, shard_bytes, encoding)
+    except BaseException:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"split source file {source_file} into {len(shards)} shards")
+
+    return shard_dir, shards
+
+def merge_exports(shard_exports, export_file):
+    """Concatenate the csv exports of all shards in order into the export
+    file, only keeping the header of the first one."""
+    export_path = pathlib.Path(export_file)
+    export_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_file = tempfile.mkstemp(
+        dir=str(export_path.parent), prefix=f".{export_path.name}.", suffix=".part")
+
+    try:
+        os.chmod(temp_file, FILE_MODE)
+        with open(fd, mode="w", encoding="UTF-8", newline="") as fo:
+            for index, shard_export in enumerate(shard_exports):
+                with(open(file=shard_export, mode="r", encoding="UTF-8", newline="")) as fi:
+                    rows = csv_rows(fi)
+                    header = next(rows, "")
+                    if index == 0:
+                        fo.write(header)
+                    for row in rows:
+                        fo.write(row)
+        os.replace(temp_file, str(export_path))
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+    logger.info(f"merged {len(shard_exports)} shard exports into export file {export_file}")
+
+    return export_file
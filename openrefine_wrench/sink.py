@@ -0,0 +1,133 @@
+import csv
+import gzip
+import io
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+from openrefine_wrench.openrefine_api_calls import FILE_MODE
+from openrefine_wrench.sharding import csv_rows
+
+logger = logging.getLogger(__name__)
+
+def _quoted(value):
+    fo = io.StringIO()
+    csv.writer(fo, lineterminator="").writerow([value])
+    return fo.getvalue()
+
+class ExportSink:
+    """Consolidated output of the csv exports of all projects.
+
+    The exports are appended one after the other through a single writer,
+    with the header of the first export written once per output file.
+    With max_bytes the output rolls over to a new numbered file
+    (<name>.00000.csv, <name>.00001.csv, ...) once a file holds max_bytes
+    (uncompressed), each starting with the header. Output files ending
+    with .gz are gzip compressed. Every output file is written to a
+    temporary file next to it and renamed when complete.
+
+    Args:
+        output_file:    path of the output file
+        max_bytes:      optional size of the rolling output files
+        source_column:  optional name of a first column with the source
+                        file of each row
+    """
+
+    def __init__(self, output_file, max_bytes=None, source_column=None):
+        self.output_path = pathlib.Path(output_file)
+        self.max_bytes = max_bytes
+        self.source_column = source_column
+        self.output_files = []
+        self.header = None
+
+        self._compress = self.output_path.suffix == ".gz"
+        self._fo = None
+        self._temp_file = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _next_path(self):
+        if self.max_bytes is None:
+            return self.output_path
+
+        name = self.output_path.name
+        suffix = ".gz" if self._compress else ""
+        stem = name[:-len(suffix)] if suffix else name
+        stem, dot, extension = stem.rpartition(".")
+        if not dot:
+            stem, extension = extension, ""
+        return self.output_path.with_name(
+            f"{stem}.{len(self.output_files):05d}"
+            + (f".{extension}" if extension else "") + suffix)
+
+    def _open(self):
+        path = self._next_path()
+        fd, self._temp_file = tempfile.mkstemp(
+            dir=str(path.parent), prefix=f".{path.name}.", suffix=".part")
+        os.chmod(self._temp_file, FILE_MODE)
+        if self._compress:
+            os.close(fd)
+            self._fo = gzip.open(self._temp_file, mode="wt", encoding="UTF-8", newline="")
+        else:
+            self._fo = open(fd, mode="w", encoding="UTF-8", newline="")
+        self.output_files.append(str(path))
+        self._fo.write(self.header)
+        self._size = len(self.header)
+
+    def _close(self):
+        if self._fo is None:
+            return
+        self._fo.close()
+        os.replace(self._temp_file, self.output_files[-1])
+        self._fo = None
+
+    def add(self, export_file, source_file=None):
+        """Append the rows of an export, a ValueError is raised if its header
+        differs from the header of the output."""
+        with(open(file=export_file, mode="r", encoding="UTF-8", newline="")) as fi:
+            rows = csv_rows(fi)
+            header = next(rows, "")
+            prefix = ""
+            if self.source_column is not None:
+                header = _quoted(self.source_column) + "," + header
+                prefix = _quoted(str(source_file)) + ","
+
+            with self._lock:
+                if self.header is None:
+                    self.header = header
+                elif header != self.header:
+                    raise ValueError(
+                        f"header of export file {export_file} differs from the output header")
+
+                if self._fo is None:
+                    self._open()
+
+                for row in rows:
+                    if not row.endswith("\n"):
+                        row += "\n"
+                    if self.max_bytes is not None and self._size >= self.max_bytes:
+                        self._close()
+                        self._open()
+                    self._fo.write(prefix + row)
+                    self._size += len(prefix) + len(row)
+
+    def close(self):
+        """complete the output, an output file with the header only (if any)
+        is written if nothing was added"""
+        with self._lock:
+            if self._fo is None and not self.output_files:
+                self.header = self.header or ""
+                self._open()
+            self._close()
+
+        logger.info(f"wrote consolidated output to {', '.join(self.output_files)}")
+
+    def abort(self):
+        """discard the output file in progress"""
+        with self._lock:
+            if self._fo is not None:
+                self._fo.close()
+                os.remove(self._temp_file)
+                self.output_files.pop()
+                self._fo = None
@@ -0,0 +1,298 @@
+import bz2
+import csv
+import gzip
+import io
+import json
+import logging
+import random
+import socket
+import threading
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import gmtime, sleep, strftime, time
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+class StandinState:
+    """Projects and settings of a stand-in server.
+
+    Args:
+        latency:        seconds every post request is delayed
+        async_duration: seconds the operations of a project run as async
+                        process, applies answer "pending" if set
+        error_rate:     share of post requests answered with a server error
+        export_factor:  number of times the rows are repeated in exports
+        capacity:       number of projects held without slowdown, the latency
+                        grows with the square of the projects above it
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        async_duration=0.0,
+        error_rate=0.0,
+        export_factor=1,
+        capacity=None):
+        self.latency = latency
+        self.async_duration = async_duration
+        self.error_rate = error_rate
+        self.export_factor = export_factor
+        self.capacity = capacity
+
+        self.lock = threading.Lock()
+        self.projects = {}
+        self.tokens = set()
+        self.connections = 0
+        self.requests = {}
+
+    def count(self, command):
+        with self.lock:
+            self.requests[command] = self.requests.get(command, 0) + 1
+
+def _parse_multipart(body, content_type):
+    """form fields of a multipart body as name to list of (filename, value)"""
+    boundary = content_type.split("boundary=", 1)[1].strip("\"").encode("latin-1")
+    fields = {}
+
+    for part in body.split(b"--" + boundary):
+        if b"\r\n\r\n" not in part:
+            continue
+        head, value = part.split(b"\r\n\r\n", 1)
+        if value.endswith(b"\r\n"):
+            value = value[:-2]
+        head = head.decode("latin-1")
+        name = head.split("name=\"", 1)[1].split("\"", 1)[0]
+        filename = None
+        if "filename=\"" in head:
+            filename = head.split("filename=\"", 1)[1].split("\"", 1)[0]
+        fields.setdefault(name, []).append((filename, value))
+
+    return fields
+
+def _import_rows(project_files, options):
+    """header and (file name, row) pairs of the uploaded csv files, gz and
+    bz2 compressed files and the files of zip archives included"""
+    header = None
+    rows = []
+
+    for filename, data in _uncompressed(project_files):
+        reader = csv.reader(io.StringIO(
+            data.decode(options.get("encoding") or "UTF-8"), newline=""))
+        file_header = next(reader, [])
+        header = header or file_header
+        rows.extend((filename, row) for row in reader)
+
+    return header or [], rows
+
+def _uncompressed(project_files):
+    for filename, data in project_files:
+        if filename.endswith(".gz"):
+            yield filename[:-3], gzip.decompress(data)
+        elif filename.endswith(".bz2"):
+            yield filename[:-4], bz2.decompress(data)
+        elif filename.endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for name in archive.namelist():
+                    yield name, archive.read(name)
+        else:
+            yield filename, data
+
+def _export_rows(project, export_factor, form=None):
+    """csv or tsv export of the rows, template exports repeat the (not
+    evaluated) template per row"""
+    form = form or {}
+    export_format = form.get("format", ["csv"])[0]
+
+    if export_format == "template":
+        rows = [row for _ in range(export_factor) for row in project["rows"]]
+        return (
+            form.get("prefix", [""])[0]
+            + form.get("separator", [""])[0].join(form["template"][0] for _ in rows)
+            + form.get("suffix", [""])[0]).encode("UTF-8")
+
+    fo = io.StringIO(newline="")
+    writer = csv.writer(
+        fo, lineterminator="\n", delimiter="\t" if export_format == "tsv" else ",")
+
+    if project["include_file_sources"]:
+        writer.writerow(["File"] + project["header"])
+        for _ in range(export_factor):
+            writer.writerows([filename] + row for filename, row in project["rows"])
+    else:
+        writer.writerow(project["header"])
+        for _ in range(export_factor):
+            writer.writerows(row for _, row in project["rows"])
+
+    return fo.getvalue().encode("UTF-8")
+
+def _handler(state):
+    class StandinHandler(BaseHTTPRequestHandler):
+        """the openrefine commands used by openrefine-wrench, uploads are
+        imported as csv and the operations aren't applied to the rows"""
+
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # headers and body are written separately, don't let them wait
+            # for the delayed ack of the client
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with state.lock:
+                state.connections += 1
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, code, body, content_type="application/json", headers=None):
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode("UTF-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            if self.headers.get("Transfer-Encoding") == "chunked":
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+                return b"".join(chunks)
+
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            command = url.path.rsplit("/", 1)[-1]
+            query = parse_qs(url.query)
+            state.count(command)
+
+            if url.path == "/project":
+                return self._send(200, b"<html></html>", "text/html")
+
+            if command == "get-csrf-token":
+                token = uuid.uuid4().hex
+                with state.lock:
+                    state.tokens.add(token)
+                return self._send(200, {"token": token})
+
+            if command == "get-processes":
+                project = state.projects.get(query.get("project", [None])[0])
+                processes = []
+                if project is not None and project.get("async_until", 0) > time():
+                    done = 1 - (project["async_until"] - time()) / state.async_duration
+                    processes.append({
+                        "description": "stand-in operations",
+                        "progress": int(done * 100),
+                        "status": "running"})
+                return self._send(200, {"processes": processes})
+
+            if command == "get-all-project-metadata":
+                return self._send(200, {"projects": {
+                    project_id: project["metadata"]
+                    for project_id, project in list(state.projects.items())}})
+
+            self._send(404, b"not found", "text/plain")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            command = url.path.rsplit("/", 1)[-1]
+            query = parse_qs(url.query)
+            state.count(command)
+
+            body = self._body()
+
+            if state.latency:
+                load = 1.0
+                if state.capacity:
+                    load = max(1.0, len(state.projects) / state.capacity) ** 2
+                sleep(state.latency * load)
+
+            if query.get("csrf_token", [None])[0] not in state.tokens:
+                return self._send(
+                    200, {"code": "error", "message": "Missing or invalid csrf_token parameter"})
+
+            if state.error_rate and random.random() < state.error_rate:
+                return self._send(500, b"injected server error", "text/plain")
+
+            if command == "create-project-from-upload":
+                return self._create(body)
+
+            form = parse_qs(body.decode("UTF-8"))
+            project_id = form.get("project", [None])[0]
+            project = state.projects.get(project_id)
+
+            if project is None and command in ("apply-operations", "export-rows"):
+                return self._send(500, b"project not found", "text/plain")
+
+            if command == "apply-operations":
+                if state.async_duration:
+                    project["async_until"] = time() + state.async_duration
+                    return self._send(200, {"code": "pending"})
+                return self._send(200, {"code": "ok"})
+
+            if command == "export-rows":
+                if form.get("format", ["csv"])[0] not in ("csv", "tsv", "template"):
+                    return self._send(500, b"export format not supported", "text/plain")
+                return self._send(
+                    200,
+                    _export_rows(project, state.export_factor, form),
+                    {"csv": "text/csv", "tsv": "text/tab-separated-values"}.get(
+                        form.get("format", ["csv"])[0], "text/plain") + ";charset=UTF-8")
+
+            if command == "delete-project":
+                with state.lock:
+                    state.projects.pop(project_id, None)
+                return self._send(200, {"code": "ok"})
+
+            self._send(404, b"not found", "text/plain")
+
+        def _create(self, body):
+            fields = _parse_multipart(body, self.headers["Content-Type"])
+            options = {}
+            if "options" in fields:
+                options = json.loads(fields["options"][0][1].decode("UTF-8"))
+            header, rows = _import_rows(fields.get("project-file", []), options)
+
+            project_id = str(random.randint(10 ** 12, 10 ** 13 - 1))
+            with state.lock:
+                state.projects[project_id] = {
+                    "header": header,
+                    "rows": rows,
+                    "include_file_sources": bool(options.get("includeFileSources")),
+                    "metadata": {
+                        "name": fields["project-name"][0][1].decode("UTF-8"),
+                        "created": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+                        "tags": options.get("projectTags") or []}}
+
+            self._send(302, b"", "text/plain", {"Location": f"/project?project={project_id}"})
+
+    return StandinHandler
+
+def serve(host="127.0.0.1", port=0, **settings):
+    """Start a stand-in server in a background thread, port 0 picks a free
+    port. The settings are passed to StandinState.
+
+    Returns:
+        server:         the running server, its state as server.state and
+                        the port as server.server_address[1]
+    """
+    state = StandinState(**settings)
+    server = ThreadingHTTPServer((host, port), _handler(state))
+    server.daemon_threads = True
+    server.state = state
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    logger.info(f"openrefine stand-in listening on {host}:{server.server_address[1]}")
+
+    return server
@@ -26,6 +26,8 @@ setup(
             "openrefine-wrench-apply=openrefine_wrench.openrefine_wrench:openrefine_wrench_apply",
             "openrefine-wrench-export=openrefine_wrench.openrefine_wrench:openrefine_wrench_export",
             "openrefine-wrench-delete=openrefine_wrench.openrefine_wrench:openrefine_wrench_delete",
+            "openrefine-wrench-gc=openrefine_wrench.openrefine_wrench:openrefine_wrench_gc",
+            "openrefine-wrench-benchmark=openrefine_wrench.openrefine_wrench:openrefine_wrench_benchmark",
         ],
     },
 )
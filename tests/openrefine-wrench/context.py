@@ -6,4 +6,20 @@ sys.path.insert(
         os.path.join(
             os.path.dirname(__file__), "../../")))
 
-from openrefine_wrench import openrefine_api_calls, openrefine_wrench
+from openrefine_wrench import (
+    backends,
+    batching,
+    compression,
+    concurrency,
+    discovery,
+    journal,
+    manifest,
+    metrics,
+    openrefine_api_calls,
+    openrefine_wrench,
+    profiling,
+    project_gc,
+    routing,
+    sharding,
+    sink,
+    standin)
@@ -0,0 +1,71 @@
+import pytest
+
+from context import backends
+
+def test_parse_backend():
+    assert backends.parse_backend("localhost") == ("localhost", "3333")
+    assert backends.parse_backend("localhost:3334") == ("localhost", "3334")
+    assert backends.parse_backend(" 10.0.0.1:80 ", "3333") == ("10.0.0.1", "80")
+
+def test_backend_pool():
+    pool = backends.BackendPool(
+        [("host_a", 3333), ("host_b", 3333)], max_failures=2, retry_after=60)
+
+    assert pool.acquire() == ("host_a", "3333")
+    assert pool.acquire() == ("host_b", "3333")
+    assert pool.acquire() == ("host_a", "3333")
+
+    pool.release("host_a", "3333")
+    pool.release("host_a", "3333")
+
+    assert pool.in_flight() == {"host_a:3333": 0, "host_b:3333": 1}
+    assert pool.acquire() == ("host_a", "3333")
+
+    pool.failed("host_a", "3333")
+    pool.succeeded("host_a", "3333")
+    pool.failed("host_a", "3333")
+
+    assert pool.acquire() == ("host_a", "3333")
+
+    pool.failed("host_a", "3333")
+
+    assert pool.acquire() == ("host_b", "3333")
+    assert pool.acquire() == ("host_b", "3333")
+
+    pool.failed("host_b", "3333")
+    pool.failed("host_b", "3333")
+
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+def test_backend_pool_memory():
+    pool = backends.BackendPool(
+        [("host_a", "3333"), ("host_b", "3333")], shared=False)
+
+    # placed by the estimated memory of the projects in flight
+    assert pool.acquire(memory=100) == ("host_a", "3333")
+    assert pool.acquire(memory=10) == ("host_b", "3333")
+    assert pool.acquire(memory=10) == ("host_b", "3333")
+
+    pool.release("host_a", "3333", memory=100)
+    assert pool.acquire(memory=10) == ("host_a", "3333")
+
+def test_backend_pool_memory_budget():
+    pool = backends.BackendPool(
+        [("host_a", "3333"), ("host_b", "3333")], memory_budget=100)
+
+    # the budget holds per backend, not for all backends together
+    assert pool.acquire(memory=60, wait=False) == ("host_a", "3333")
+    assert pool.acquire(memory=60, wait=False) == ("host_b", "3333")
+    assert pool.acquire(memory=60, wait=False) is None
+    assert pool.acquire(memory=40, wait=False) == ("host_a", "3333")
+
+    # a project larger than the budget goes to a backend without projects
+    pool.release("host_b", "3333", memory=60)
+    assert pool.acquire(memory=500, wait=False) == ("host_b", "3333")
+
+    # the remaining backend doesn't take the budget of one taken out
+    pool.release("host_b", "3333", memory=500)
+    for _ in range(pool.max_failures):
+        pool.failed("host_b", "3333")
+    assert pool.acquire(memory=60, wait=False) is None
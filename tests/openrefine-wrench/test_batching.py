@@ -0,0 +1,45 @@
+import pathlib
+from tempfile import TemporaryDirectory
+
+from context import batching
+
+def _write(path, content):
+    with open(path, mode="w", encoding="UTF-8", newline="") as fo:
+        fo.write(content)
+
+    return str(path)
+
+def test_batch_files():
+    with TemporaryDirectory() as source_dir:
+        files = [
+            _write(f"{source_dir}/test_{num}.csv", "x" * 10) for num in range(5)]
+        pathlib.Path(f"{source_dir}/sub").mkdir()
+        files.append(_write(f"{source_dir}/sub/test_0.csv", "x" * 10))
+
+        assert list(batching.batch_files(files, max_files=2)) == [
+            files[0:2], files[2:4], files[4:6]]
+        assert list(batching.batch_files(files, max_files=10, max_bytes=25)) == [
+            files[0:2], files[2:4], files[4:6]]
+        assert list(batching.batch_files(files, max_files=10)) == [
+            files[0:5], files[5:6]]
+
+def test_split_export():
+    with TemporaryDirectory() as export_dir:
+        batch_export_file = _write(
+            f"{export_dir}/.batch.csv",
+            "File,first_name,last_name\n"
+            "a.csv,Baked,BEANS\n"
+            "a.csv,Lovely,SPAM\n"
+            "b.csv,\"Wonderful, really\",SPAM\n")
+
+        export_files = batching.split_export(
+            batch_export_file, ["src/a.csv", "src/b.csv", "src/c.csv"], export_dir)
+
+        assert sorted(export_files) == [
+            f"{export_dir}/a.csv", f"{export_dir}/b.csv", f"{export_dir}/c.csv"]
+        assert pathlib.Path(f"{export_dir}/a.csv").read_text(encoding="UTF-8") == (
+            "first_name,last_name\nBaked,BEANS\nLovely,SPAM\n")
+        assert pathlib.Path(f"{export_dir}/b.csv").read_text(encoding="UTF-8") == (
+            "first_name,last_name\n\"Wonderful, really\",SPAM\n")
+        assert pathlib.Path(f"{export_dir}/c.csv").read_text(encoding="UTF-8") == (
+            "first_name,last_name\n")
@@ -0,0 +1,29 @@
+import bz2
+import pathlib
+import tempfile
+
+from context import batching, compression, openrefine_api_calls
+
+def test_source_names():
+    assert compression.is_source_file("a.csv.gz", "csv")
+    assert compression.is_source_file("a.csv.bz2", "csv")
+    assert compression.is_source_file("bundle.zip", "csv")
+    assert not compression.is_source_file("a.xml.gz", "csv")
+
+    # the export name drops the compression suffix
+    assert openrefine_api_calls.export_file_path("src/a.csv.gz", "export") == "export/a.csv"
+    assert openrefine_api_calls.export_file_path("src/bundle.zip", "export") == "export/bundle.csv"
+
+def test_open_source_and_batches():
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_file = pathlib.Path(work_dir) / "a.csv.bz2"
+        source_file.write_bytes(bz2.compress(b"a,b\n1,2\n"))
+        archive = pathlib.Path(work_dir) / "bundle.zip"
+        archive.write_bytes(b"")
+
+        with compression.open_source(source_file, encoding="UTF-8", newline="") as fi:
+            assert fi.read() == "a,b\n1,2\n"
+
+        # archives are batches of their own
+        assert list(batching.batch_files([source_file, archive, source_file.with_name("a.csv.bz2")], 5)) == [
+            [str(archive)], [str(source_file)], [str(source_file)]]
@@ -0,0 +1,115 @@
+import threading
+
+from context import concurrency
+
+def _finish(limiter, jobs, seconds=1.0, failed=False):
+    for _ in range(jobs):
+        limiter._in_flight += 1
+        limiter.done(seconds, 0, failed=failed)
+
+def test_adaptive_concurrency():
+    limiter = concurrency.AdaptiveConcurrency(min_workers=2, max_workers=6)
+
+    assert limiter.limit == 2
+
+    # one more project in flight after each window without errors
+    _finish(limiter, 2)
+    assert limiter.limit == 3
+    _finish(limiter, 3 + 4 + 5 + 6 + 6)
+    assert limiter.limit == 6
+
+    # halved on latency above the tolerance, but not below the lower bound
+    _finish(limiter, 6, seconds=3.0)
+    assert limiter.limit == 3
+    _finish(limiter, 1, failed=True)
+    assert limiter.limit == 2
+
+def test_adaptive_concurrency_cooldown():
+    limiter = concurrency.AdaptiveConcurrency(min_workers=1, max_workers=8)
+    limiter.limit = 8
+
+    # errors of the projects in flight when the limit was decreased count once
+    limiter._in_flight = 8
+    for _ in range(4):
+        limiter.done(1.0, 0, failed=True)
+    assert limiter.limit == 4
+
+    limiter.done(1.0, 0, failed=True)
+    assert limiter.limit == 4
+
+def test_adaptive_concurrency_gate():
+    limiter = concurrency.AdaptiveConcurrency(min_workers=2, max_workers=2)
+    admitted = []
+
+    def _admit():
+        for job in limiter.gate(range(3)):
+            admitted.append(job)
+
+    admit = threading.Thread(target=_admit)
+    admit.start()
+    admit.join(0.1)
+
+    assert admitted == [0, 1]
+
+    limiter.done(1.0, 0)
+    admit.join(1)
+
+    assert admitted == [0, 1, 2]
+
+def test_memory_budget_gate():
+    budget = concurrency.MemoryBudget(100)
+    jobs = [{"size": size} for size in (80, 60, 10, 50, 10)]
+    admitted = []
+
+    def _admit():
+        for job in budget.gate(jobs, estimate=lambda job: job["size"]):
+            admitted.append(job["size"])
+
+    admit = threading.Thread(target=_admit, daemon=True)
+    admit.start()
+    admit.join(0.1)
+
+    # small files go around the large ones waiting for memory
+    assert admitted == [80, 10, 10]
+    assert budget.in_use == 100
+
+    budget.done(jobs[0])
+    admit.join(0.1)
+    assert admitted == [80, 10, 10, 60]
+
+    budget.done(jobs[1])
+    admit.join(1)
+    assert admitted == [80, 10, 10, 60, 50]
+    assert not admit.is_alive()
+
+def test_memory_budget_oversized_job():
+    budget = concurrency.MemoryBudget(100)
+    jobs = [{"size": 500}, {"size": 10}]
+
+    gate = budget.gate(jobs, estimate=lambda job: job["size"])
+
+    # a job larger than the budget still runs, alone
+    assert next(gate)["size"] == 500
+    budget.done(jobs[0])
+    assert next(gate)["size"] == 10
+
+def test_memory_budget_place():
+    servers = {"a": 0, "b": 0}
+
+    def _place(job):
+        for server, in_use in servers.items():
+            if in_use + job["memory_estimate"] <= 100:
+                servers[server] += job["memory_estimate"]
+                job["server"] = server
+                return True
+        return False
+
+    budget = concurrency.MemoryBudget(100, place=_place)
+    jobs = [{"size": 60} for _ in range(3)]
+    gate = budget.gate(jobs, estimate=lambda job: job["size"])
+
+    # the budget holds per server, the third job waits for a release
+    assert [next(gate)["server"], next(gate)["server"]] == ["a", "b"]
+    servers["a"] -= 60
+    budget.done(jobs[0])
+    assert next(gate)["server"] == "a"
@@ -0,0 +1,76 @@
+import logging
+import pathlib
+import tempfile
+
+from context import discovery, openrefine_api_calls, openrefine_wrench
+
+def test_discover_files():
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = pathlib.Path(work_dir)
+        for path in ("a.csv", "b.xml", "sub/c.csv", ".shards/d.csv", "export/a.csv"):
+            (work_dir / path).parent.mkdir(exist_ok=True)
+            (work_dir / path).write_text("a\n")
+
+        def _names(**kwargs):
+            return sorted(
+                str(file.relative_to(work_dir))
+                for file in discovery.discover_files(
+                    work_dir, "csv", skip_dirs=[work_dir / "export"], **kwargs))
+
+        assert _names() == ["a.csv"]
+        # hidden and skipped dirs are not walked
+        assert _names(recursive=True) == ["a.csv", "sub/c.csv"]
+
+        # a symlink back to a parent doesn't walk the tree again
+        (work_dir / "sub/loop").symlink_to(work_dir, target_is_directory=True)
+        assert _names(recursive=True) == ["a.csv", "sub/c.csv"]
+
+def test_nested_export_files(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+
+    # nested source files keep their subdirectory below the export dir
+    assert openrefine_api_calls.export_file_path("src/x.csv", "export", source_dir="src") == (
+        "export/x.csv")
+    assert openrefine_api_calls.export_file_path(
+        "src/sub/x.csv.gz", "export", source_dir="src") == "export/sub/x.csv"
+    assert openrefine_api_calls.export_file_path("other/x.csv", "export", source_dir="src") == (
+        "export/x.csv")
+
+    # source files with the same export file fail, except for the first one
+    failed = []
+    files = list(openrefine_wrench._unique_exports(
+        ["src/x.csv", "other/x.csv", "src/sub/x.csv"],
+        lambda file: openrefine_api_calls.export_file_path(file, "export", source_dir="src"),
+        failed))
+
+    assert files == ["src/x.csv", "src/sub/x.csv"]
+    assert [(job["project_file"], job["error"]["stage"]) for job in failed] == [
+        ("other/x.csv", "prep")]
+
+    # a directory at a time only the claims of the current directory are kept
+    failed = []
+    files = list(openrefine_wrench._unique_exports(
+        ["src/x.csv", "src/x.csv.gz", "src/sub/x.csv", "src/sub/y.csv", "src/sub/x.zip"],
+        lambda file: openrefine_api_calls.export_file_path(file, "export", source_dir="src"),
+        failed,
+        per_dir=True))
+
+    assert files == ["src/x.csv", "src/sub/x.csv", "src/sub/y.csv"]
+    assert [job["project_file"] for job in failed] == ["src/x.csv.gz", "src/sub/x.zip"]
+
+def test_filter_files():
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = pathlib.Path(work_dir)
+        (work_dir / "sub").mkdir()
+        for path, size in (("a.csv", 10), ("b.csv", 100), ("sub/a.csv", 1000)):
+            (work_dir / path).write_text("x" * size)
+        files = [work_dir / "a.csv", work_dir / "b.csv", work_dir / "sub/a.csv"]
+
+        def _names(**kwargs):
+            return [
+                str(file.relative_to(work_dir))
+                for file in discovery.filter_files(files, base_dir=work_dir, **kwargs)]
+
+        assert _names(include=["a.csv"]) == ["a.csv", "sub/a.csv"]
+        assert _names(exclude=["sub/*"]) == ["a.csv", "b.csv"]
+        assert _names(min_size=50, max_size=500) == ["b.csv"]
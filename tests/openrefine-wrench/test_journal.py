@@ -0,0 +1,54 @@
+import pathlib
+from tempfile import TemporaryDirectory
+
+from context import journal
+
+def test_journal():
+    with TemporaryDirectory() as work_dir:
+        source_files = []
+        for num in range(3):
+            source_file = pathlib.Path(f"{work_dir}/test_{num}.csv")
+            source_file.write_text(f"first_name,last_name\nBaked,Beans {num}\n", encoding="UTF-8")
+            source_files.append(str(source_file))
+
+        run = journal.Journal(work_dir, settings_hash="a")
+        run.start()
+
+        for num, source_file in enumerate(source_files):
+            run.record(
+                source_file,
+                "create",
+                host="localhost",
+                port="3333",
+                project_id=str(num),
+                project_name=f"test_{num}",
+                sources=journal.source_stats([source_file]))
+            run.record(source_file, "apply")
+
+        run.record(source_files[0], "export", exports=[])
+        run.record(source_files[0], "delete")
+
+        # partially written line of a killed run
+        with open(run.path, mode="a", encoding="UTF-8") as fo:
+            fo.write('{"key": ')
+
+        run = journal.Journal(work_dir, settings_hash="a")
+        unfinished = run.load()
+
+        assert sorted(job["project_id"] for job in unfinished.values()) == ["1", "2"]
+
+        pathlib.Path(source_files[2]).write_text("first_name,last_name\nLovely,Spam\n", encoding="UTF-8")
+
+        assert run.take(source_files[0], [source_files[0]]) is None
+        assert run.take(source_files[1], [source_files[1]])["project_id"] == "1"
+        assert run.take(source_files[2], [source_files[2]]) is None
+
+        run.start(carried=run.unfinished.values())
+        run = journal.Journal(work_dir, settings_hash="b")
+
+        assert [job["project_id"] for job in run.load().values()] == ["2"]
+        assert run.take(source_files[2], [source_files[2]]) is None
+
+        run.remove()
+
+        assert not run.path.exists()
@@ -0,0 +1,80 @@
+import os
+import pathlib
+from tempfile import TemporaryDirectory
+
+from context import manifest
+
+def test_manifest():
+    with TemporaryDirectory() as work_dir:
+        source_files = []
+        for num in range(3):
+            source_file = pathlib.Path(f"{work_dir}/test_{num}.csv")
+            source_file.write_text(f"first_name,last_name\nBaked,Beans {num}\n", encoding="UTF-8")
+            pathlib.Path(f"{work_dir}/test_{num}_export.csv").write_text("", encoding="UTF-8")
+            source_files.append(source_file)
+
+        run = manifest.Manifest(work_dir, mappings_hash="a", options_hash="b")
+
+        assert list(run.changed_files(source_files)) == source_files
+
+        for source_file in source_files:
+            run.record(
+                source_file,
+                f"{work_dir}/{source_file.stem}_export.csv",
+                content_hash=manifest.file_hash(source_file))
+        run.save()
+
+        run = manifest.Manifest(work_dir, mappings_hash="a", options_hash="b")
+
+        assert list(run.changed_files(source_files)) == []
+        assert list(run.changed_files(source_files, force=True)) == source_files
+
+        # same content with a new modification time is still unchanged
+        os.utime(source_files[0], (0, 0))
+        source_files[1].write_text("first_name,last_name\nLovely,Spam\n", encoding="UTF-8")
+        os.remove(f"{work_dir}/test_2_export.csv")
+
+        assert list(run.changed_files(source_files)) == source_files[1:]
+
+        run = manifest.Manifest(work_dir, mappings_hash="c", options_hash="b")
+
+        assert list(run.changed_files(source_files)) == source_files
+
+def test_manifest_record_passed_hash(monkeypatch):
+    with TemporaryDirectory() as work_dir:
+        source_file = pathlib.Path(f"{work_dir}/test.csv")
+        source_file.write_text("first_name,last_name\nBaked,Beans\n", encoding="UTF-8")
+
+        run = manifest.Manifest(work_dir, mappings_hash="a", options_hash="b")
+        assert list(run.changed_files([source_file], force=True)) == [source_file]
+
+        # a hash passed along isn't computed again
+        monkeypatch.setattr(manifest, "file_hash", None)
+        run.record(source_file, f"{work_dir}/test_export.csv", content_hash="abc")
+
+        assert run.entries[str(source_file.resolve())]["content_hash"] == "abc"
+
+def test_manifest_estimate():
+    with TemporaryDirectory() as work_dir:
+        source_files = []
+        for num, rows in enumerate((10, 1000, 100)):
+            source_file = pathlib.Path(f"{work_dir}/test_{num}.csv")
+            source_file.write_text("first_name,last_name\n" + "Baked,Beans\n" * rows, encoding="UTF-8")
+            source_files.append(source_file)
+
+        run = manifest.Manifest(work_dir, mappings_hash="a", options_hash="b")
+
+        # largest files first as long as no durations are recorded
+        assert sorted(source_files, key=run.estimate, reverse=True) == [
+            source_files[1], source_files[2], source_files[0]]
+
+        # a slow small file and a fast larger one of an earlier run
+        run.record(source_files[0], source_files[0], seconds=60)
+        run.record(source_files[2], source_files[2], seconds=1)
+        run.save()
+
+        run = manifest.Manifest(work_dir, mappings_hash="a", options_hash="b")
+
+        assert run.estimate(source_files[0]) == 60
+        assert sorted(source_files, key=run.estimate, reverse=True) == [
+            source_files[1], source_files[0], source_files[2]]
@@ -0,0 +1,64 @@
+import json
+import pathlib
+from tempfile import TemporaryDirectory
+
+from context import metrics
+
+def test_quantile():
+    values = list(range(1, 101))
+
+    assert metrics.quantile(values, 0.5) == 50
+    assert metrics.quantile(values, 0.95) == 95
+    assert metrics.quantile([3], 0.95) == 3
+    assert metrics.quantile([], 0.5) is None
+
+def test_run_metrics():
+    with TemporaryDirectory() as work_dir:
+        run = metrics.RunMetrics(metrics_file=f"{work_dir}/metrics.jsonl")
+
+        for num in range(10):
+            run.add({
+                "source_files": [f"test_{num}.csv"],
+                "status": "failed" if num == 9 else "ok",
+                "stages": {"create": num / 10, "apply": 1.0},
+                "seconds": num / 10 + 1.0,
+                "bytes_sent": 100,
+                "bytes_received": 50})
+        run.close()
+
+        summary = run.summary()
+
+        assert summary["files"] == {"ok": 9, "failed": 1}
+        assert summary["bytes"] == {"sent": 1000, "received": 500}
+        assert summary["stages"]["create"] == {"p50": 0.4, "p95": 0.9, "max": 0.9, "count": 10}
+
+        with open(f"{work_dir}/metrics.jsonl", mode="r", encoding="UTF-8") as fi:
+            records = [json.loads(line) for line in fi]
+
+        assert len(records) == 10
+        assert records[9]["status"] == "failed"
+
+        run.write_prometheus(f"{work_dir}/openrefine_wrench.prom")
+        textfile = pathlib.Path(f"{work_dir}/openrefine_wrench.prom").read_text(encoding="UTF-8")
+
+        assert 'openrefine_wrench_stage_seconds{stage="apply",quantile="0.5"} 1.0' in textfile
+        assert 'openrefine_wrench_files{status="failed"} 1' in textfile
+        assert 'openrefine_wrench_bytes{direction="sent"} 1000' in textfile
+
+def test_run_metrics_shards():
+    run = metrics.RunMetrics()
+
+    for source_file, statuses in (("a.csv", ["ok", "ok", "ok"]), ("b.csv", ["ok", "failed", "ok"])):
+        for num, status in enumerate(statuses):
+            run.add({
+                "source_files": [f"shards/{source_file}.{num:05d}"],
+                "shard_of": source_file,
+                "status": status,
+                "stages": {},
+                "bytes_sent": 0,
+                "bytes_received": 0})
+    run.add({
+        "source_files": ["c.csv"], "status": "ok", "stages": {}, "bytes_sent": 0, "bytes_received": 0})
+
+    # shards count once for their source file
+    assert run.summary()["files"] == {"ok": 2, "failed": 1}
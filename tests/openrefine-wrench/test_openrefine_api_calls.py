@@ -1,12 +1,16 @@
+import io
 import csv
+import gzip
 import json
+import os
 import pytest
 import pathlib
 from os import getpid
 from tempfile import TemporaryDirectory
-from requests.exceptions import RequestException
+from requests import Response
+from requests.exceptions import ChunkedEncodingError, HTTPError, ReadTimeout, RequestException
 
-from context import openrefine_api_calls, openrefine_wrench
+from context import manifest, openrefine_api_calls, openrefine_wrench, standin
 
 csv_sample_data = [
     {"first_name": "Baked", "last_name": "Beans"},
@@ -130,3 +134,150 @@ def test_csv_or_project(_docker_handler):
             project_id=project_id)
 
         assert delete_resp == "ok"
+
+def test_get_client_is_reused():
+    client = openrefine_api_calls.get_client(host="localhost", port="3333")
+
+    assert openrefine_api_calls.get_client(host="localhost", port=3333) is client
+    assert openrefine_api_calls.get_client(host="127.0.0.1", port="3333") is not client
+
+    openrefine_api_calls.close_clients()
+
+    assert openrefine_api_calls.get_client(host="localhost", port="3333") is not client
+
+def _json_response(body):
+    resp = Response()
+    resp.status_code = 200
+    resp.headers["Content-Type"] = "application/json"
+    resp._content = json.dumps(body).encode("UTF-8")
+
+    return resp
+
+def test_request_timeout():
+    server = standin.serve(latency=2)
+
+    try:
+        client = openrefine_api_calls.OpenRefineClient(
+            "127.0.0.1", server.server_address[1], timeout=(1, 0.2))
+
+        # a stalled server raises a timeout, retried as transient error
+        with pytest.raises(ReadTimeout) as exc_info:
+            client.post("delete-project", data={"project": "1"})
+
+        assert openrefine_api_calls.is_transient_error(exc_info.value)
+        client.close()
+    finally:
+        server.shutdown()
+
+def test_is_csrf_error():
+    assert openrefine_api_calls._is_csrf_error(_json_response(
+        {"code": "error", "message": "Missing or invalid csrf_token parameter"})) == True
+    assert openrefine_api_calls._is_csrf_error(_json_response({"code": "ok"})) == False
+    assert openrefine_api_calls._is_csrf_error(_json_response(
+        {"code": "error", "message": "Project not found"})) == False
+
+def test_async_poll_interval():
+    assert openrefine_api_calls._estimate_async_remaining([], 10) is None
+    assert openrefine_api_calls._estimate_async_remaining([{"progress": 0}], 10) is None
+    assert openrefine_api_calls._estimate_async_remaining([{"progress": 25}], 10) == 30
+
+    for _ in range(100):
+        assert 0.5 <= openrefine_api_calls._next_poll_interval(1) <= 1
+        assert openrefine_api_calls._next_poll_interval(1, remaining=0.2) <= 0.2
+        assert openrefine_api_calls._next_poll_interval(
+            1, remaining=0) == openrefine_api_calls.ASYNC_POLL_MIN
+
+def test_stream_to_file():
+    resp = Response()
+    resp.status_code = 200
+    resp.headers["Content-Type"] = "text/csv; charset=ISO-8859-1"
+    resp.raw = io.BytesIO("first_name,last_name\nJürgen,Spam\n".encode("ISO-8859-1"))
+
+    with TemporaryDirectory() as export_dir:
+        export_file = f"{export_dir}/test.csv"
+
+        openrefine_api_calls._stream_to_file(resp, export_file, encoding="UTF-8")
+
+        assert [path.name for path in pathlib.Path(export_dir).iterdir()] == ["test.csv"]
+        with open(export_file, mode="r", encoding="UTF-8") as fi:
+            assert fi.read() == "first_name,last_name\nJürgen,Spam\n"
+
+def test_export_template():
+    server = standin.serve()
+    server.state.projects["1"] = {
+        "header": ["name"],
+        "rows": [("test.csv", ["Spam"]), ("test.csv", ["Eggs"])],
+        "include_file_sources": False}
+
+    try:
+        with TemporaryDirectory() as export_dir:
+            stats = {}
+            export_file = openrefine_api_calls.export_or_project_rows(
+                host="127.0.0.1",
+                port=server.server_address[1],
+                pid=getpid(),
+                project_id="1",
+                export_format="template",
+                project_file="src/test.csv.gz",
+                export_dir=export_dir,
+                stats=stats,
+                template={
+                    "template": "{\"name\": {{jsonize(cells['name'].value)}}}",
+                    "prefix": "[",
+                    "suffix": "]",
+                    "separator": ","},
+                file_suffix=".json")
+
+            # the template fields are posted along with the export format
+            assert export_file == f"{export_dir}/test.json"
+            with open(export_file, mode="r", encoding="UTF-8") as fi:
+                assert fi.read() == (
+                    "[{\"name\": {{jsonize(cells['name'].value)}}},"
+                    "{\"name\": {{jsonize(cells['name'].value)}}}]")
+            assert stats["bytes_received"] == os.path.getsize(export_file)
+    finally:
+        server.shutdown()
+
+def test_multipart_upload():
+    with TemporaryDirectory() as csv_test_data_dir:
+        csv_test_file = _create_csv_test_data(csv_test_data_dir)
+
+        upload = openrefine_api_calls._MultipartUpload(
+            fields={"project-name": "or_csv_test_project"},
+            file_field="project-file",
+            project_files=[(csv_test_file, "test.csv")])
+
+        body = b"".join(upload)
+
+        assert len(body) == upload.len
+        assert body == b"".join(upload)
+        assert b'name="project-file"; filename="test.csv"' in body
+
+        upload = openrefine_api_calls._MultipartUpload(
+            fields={"project-name": "or_csv_test_project"},
+            file_field="project-file",
+            project_files=[(csv_test_file, "test.csv")],
+            compress=True)
+
+        body = b"".join(upload)
+        file_data = body.split(b"\r\n\r\n")[-1].rsplit(b"\r\n--", 1)[0]
+
+        assert upload.len is None
+        assert b'filename="test.csv.gz"' in body
+        with open(csv_test_file, mode="rb") as fi:
+            assert gzip.decompress(file_data) == fi.read()
+
+        # the files are hashed while they are read for the upload
+        assert upload.hashes == {str(csv_test_file): manifest.file_hash(csv_test_file)}
+
+def test_is_transient_error():
+    server_error = Response()
+    server_error.status_code = 503
+    client_error = Response()
+    client_error.status_code = 404
+
+    assert openrefine_api_calls.is_transient_error(ChunkedEncodingError())
+    assert openrefine_api_calls.is_transient_error(ReadTimeout())
+    assert openrefine_api_calls.is_transient_error(HTTPError(response=server_error))
+    assert not openrefine_api_calls.is_transient_error(HTTPError(response=client_error))
+    assert not openrefine_api_calls.is_transient_error(TimeoutError())
@@ -1,4 +1,17 @@
-from context import openrefine_wrench
+import click
+import json
+import logging
+import os
+import pathlib
+import stat
+import threading
+import pytest
+import requests
+from click.testing import CliRunner
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from context import openrefine_api_calls, openrefine_wrench, standin
 
 wanted = {
     "columnWidths": None,
@@ -33,3 +46,270 @@ def test_prep_options():
         custom_options='{"encoding": "UTF-8", "separator": "#"}')
 
     assert options == wanted
+
+def test_prep_exports():
+    with TemporaryDirectory() as work_dir:
+        pathlib.Path(f"{work_dir}/rows.json").write_text(
+            '{"template": "{{jsonize(cells)}}", "separator": "\\n", "extension": ".ndjson"}',
+            encoding="UTF-8")
+        pathlib.Path(f"{work_dir}/list.json").write_text(
+            '{"template": "{{cells}}", "prefix": "[", "suffix": "]", "separator": ","}',
+            encoding="UTF-8")
+
+        exports = openrefine_wrench._prep_exports(
+            ["tsv", "xlsx"], [f"{work_dir}/rows.json", f"{work_dir}/list.json"])
+
+        # the extension is no part of the template, json by default
+        assert exports == [
+            {"format": "tsv", "suffix": ".tsv"},
+            {"format": "xlsx", "suffix": ".xlsx"},
+            {"format": "template", "suffix": ".ndjson", "template": {
+                "template": "{{jsonize(cells)}}", "separator": "\n"}},
+            {"format": "template", "suffix": ".json", "template": {
+                "template": "{{cells}}", "prefix": "[", "suffix": "]", "separator": ","}}]
+
+        # no two exports may write the same export file
+        pathlib.Path(f"{work_dir}/csv.json").write_text(
+            '{"template": "{{cells}}", "extension": "csv"}', encoding="UTF-8")
+        for export_formats, export_templates in (
+            ([], [f"{work_dir}/csv.json"]),
+            ([], [f"{work_dir}/list.json", f"{work_dir}/list.json"]),
+            (["tsv", "tsv"], [])):
+            with pytest.raises(click.BadParameter):
+                openrefine_wrench._prep_exports(export_formats, export_templates)
+
+def test_export_stage_reuses_clients(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+    server = standin.serve()
+
+    try:
+        with TemporaryDirectory() as work_dir:
+            for num in range(5):
+                server.state.projects[str(num)] = {
+                    "header": ["a"], "rows": [("test.csv", ["1"])], "include_file_sources": False}
+                openrefine_wrench._export_stage({
+                    "host": "127.0.0.1",
+                    "port": server.server_address[1],
+                    "project_id": str(num),
+                    "project_file": f"test_{num}.csv",
+                    "export_dir": work_dir,
+                    "exports": [{"format": "tsv", "suffix": ".tsv"}]})
+
+            assert sorted(path.name for path in pathlib.Path(work_dir).glob("*.tsv")) == [
+                f"test_{num}.tsv" for num in range(5)]
+
+        # one client for the csv exports and one of the export thread
+        assert server.state.connections == 2
+        assert server.state.requests["get-csrf-token"] == 2
+    finally:
+        openrefine_wrench._shutdown_export_executor()
+        openrefine_api_calls.close_clients()
+        server.shutdown()
+
+    assert openrefine_wrench._export_executor is None
+
+def test_asyncio_handler(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+
+    in_flight = []
+    max_in_flight = []
+
+    def _start_stage(job):
+        in_flight.append(job["project_file"])
+        max_in_flight.append(len(in_flight))
+        sleep(0.01)
+
+    def _done_stage(job):
+        in_flight.remove(job["project_file"])
+        job["done"] = True
+
+    monkeypatch.setattr(
+        openrefine_wrench, "STAGES", (("start", _start_stage), ("done", _done_stage)))
+
+    jobs = list(openrefine_wrench._prep_jobs(
+        [f"test_{num}.csv" for num in range(10)], export_dir="export"))
+
+    openrefine_wrench._asyncio_handler(jobs, max_workers=3)
+
+    assert all(job["done"] for job in jobs)
+    assert max(max_in_flight) <= 3
+
+def test_pipeline_handler(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+
+    lock = threading.Lock()
+    running = {"create": 0, "delete": 0, "in_flight": 0}
+    max_running = {"create": 0, "delete": 0, "in_flight": 0}
+
+    def _count(key, step):
+        with lock:
+            running[key] += step
+            max_running[key] = max(max_running[key], running[key])
+
+    def _create_stage(job):
+        _count("in_flight", 1)
+        _count("create", 1)
+        sleep(0.01)
+        _count("create", -1)
+
+    def _delete_stage(job):
+        _count("delete", 1)
+        sleep(0.01)
+        _count("delete", -1)
+        _count("in_flight", -1)
+        job["done"] = True
+
+    monkeypatch.setattr(
+        openrefine_wrench, "STAGES", (("create", _create_stage), ("delete", _delete_stage)))
+
+    jobs = list(openrefine_wrench._prep_jobs(
+        [f"test_{num}.csv" for num in range(10)], export_dir="export"))
+
+    openrefine_wrench._pipeline_handler(
+        jobs, max_workers=4, stage_workers={"create": 2, "delete": 1})
+
+    assert all(job["done"] for job in jobs)
+    assert max_running == {"create": 2, "delete": 1, "in_flight": 4}
+
+def test_run_stage_retries(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+
+    calls = []
+
+    def _flaky_stage(job):
+        calls.append(job["project_file"])
+        if len(calls) < 3:
+            raise requests.exceptions.ConnectionError("connection reset")
+
+    job = {"project_file": "test.csv", "retries": 3, "retry_backoff": 0}
+
+    openrefine_wrench._run_stage("export", _flaky_stage, job)
+
+    assert len(calls) == 3
+
+    def _broken_stage(job):
+        calls.append(job["project_file"])
+        raise ValueError("no json")
+
+    with pytest.raises(ValueError):
+        openrefine_wrench._run_stage("export", _broken_stage, job)
+
+    assert len(calls) == 4
+
+def test_handlers_isolate_failures(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+
+    def _start_stage(job):
+        if job["project_file"] == "test_3.csv":
+            raise RuntimeError("broken source file")
+
+    def _done_stage(job):
+        job["done"] = True
+
+    monkeypatch.setattr(
+        openrefine_wrench, "STAGES", (("start", _start_stage), ("done", _done_stage)))
+
+    for handler in (openrefine_wrench._asyncio_handler, openrefine_wrench._pipeline_handler):
+        jobs = list(openrefine_wrench._prep_jobs(
+            [f"test_{num}.csv" for num in range(10)], export_dir="export"))
+        finished = []
+
+        handler(jobs, max_workers=3, on_done=finished.append)
+
+        assert len(finished) == 10
+        assert [job["project_file"] for job in jobs if "error" in job] == ["test_3.csv"]
+        assert jobs[3]["error"]["stage"] == "start"
+        assert all(job.get("done") for job in jobs if "error" not in job)
+
+def test_handlers_raise_on_done_errors(monkeypatch):
+    monkeypatch.setattr(openrefine_wrench, "logger", logging.getLogger(__name__))
+    monkeypatch.setattr(openrefine_wrench, "STAGES", (("done", lambda job: None),))
+
+    def _on_done(job):
+        raise OSError(f"{job['project_file']} is gone")
+
+    for handler in (openrefine_wrench._asyncio_handler, openrefine_wrench._pipeline_handler):
+        jobs = list(openrefine_wrench._prep_jobs(
+            [f"test_{num}.csv" for num in range(10)], export_dir="export"))
+        result = []
+
+        def _run():
+            try:
+                handler(jobs, max_workers=2, on_done=_on_done)
+            except OSError as exc:
+                result.append(exc)
+
+        # a callback error aborts the run instead of leaving it waiting
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+
+        assert not thread.is_alive()
+        assert len(result) == 1
+
+@pytest.mark.parametrize("engine", ["pool", "asyncio", "pipeline"])
+def test_openrefine_wrench_standin(engine):
+    server = standin.serve(async_duration=0.1)
+
+    try:
+        with TemporaryDirectory() as work_dir:
+            source_dir = pathlib.Path(f"{work_dir}/source")
+            source_dir.mkdir()
+            for num in range(5):
+                (source_dir / f"test_{num}.csv").write_text(
+                    f"first_name,last_name\nBaked,Beans {num}\n", encoding="UTF-8")
+            pathlib.Path(f"{work_dir}/mappings.json").write_text("[]", encoding="UTF-8")
+
+            result = CliRunner().invoke(openrefine_wrench.openrefine_wrench, [
+                "--host", server.server_address[0],
+                "--port", str(server.server_address[1]),
+                "--source-dir", str(source_dir),
+                "--export-dir", work_dir,
+                "--source-format", "csv",
+                "--mappings-file", f"{work_dir}/mappings.json",
+                "--max-workers", "2",
+                "--engine", engine,
+                "--export-format", "tsv",
+                "--logfile", f"{work_dir}/openrefine-wrench.log"])
+
+            assert result.exit_code == 0, result.output
+
+            for num in range(5):
+                assert pathlib.Path(f"{work_dir}/test_{num}.csv").read_text(encoding="UTF-8") == (
+                    f"first_name,last_name\nBaked,Beans {num}\n")
+                assert pathlib.Path(f"{work_dir}/test_{num}.tsv").read_text(encoding="UTF-8") == (
+                    f"first_name\tlast_name\nBaked\tBeans {num}\n")
+                # exports get the mode of files created under the umask
+                assert stat.S_IMODE(os.stat(f"{work_dir}/test_{num}.csv").st_mode) == (
+                    openrefine_api_calls.FILE_MODE)
+
+        assert server.state.projects == {}
+    finally:
+        server.shutdown()
+
+def test_profile_group_size_is_positive():
+    for command in (openrefine_wrench.openrefine_wrench, openrefine_wrench.openrefine_wrench_apply):
+        result = CliRunner().invoke(command, ["--profile-group-size", "0"])
+
+        assert result.exit_code == 2
+        assert "--profile-group-size" in result.output
+
+def test_openrefine_wrench_benchmark():
+    with TemporaryDirectory() as work_dir:
+        result = CliRunner().invoke(openrefine_wrench.openrefine_wrench_benchmark, [
+            "--files", "4",
+            "--rows", "10",
+            "--engine", "asyncio",
+            "--max-workers", "2",
+            "--latency", "0",
+            "--work-dir", work_dir,
+            "--report-file", f"{work_dir}/report.json",
+            "--logfile", f"{work_dir}/openrefine-wrench-benchmark.log"])
+
+        assert result.exit_code == 0, result.output
+
+        with open(f"{work_dir}/report.json", mode="r", encoding="UTF-8") as fi:
+            report = json.load(fi)
+
+        assert [(run["engine"], run["max_workers"], run["failed"]) for run in report] == [
+            ("asyncio", 2, 0)]
@@ -0,0 +1,38 @@
+from context import profiling, standin
+
+OR_PROJECT = [
+    {"op": "core/text-transform", "columnName": "a", "description": "Text transform on cells in column a"},
+    {"op": "core/column-addition", "baseColumnName": "a", "newColumnName": "b", "description": "Create column b"},
+    {"op": "core/column-removal", "columnName": "c", "description": "Remove column c"}]
+
+def test_operation_profile():
+    profile = profiling.OperationProfile(OR_PROJECT, group_size=2)
+    profile.add([1.0, 3.0])
+    profile.add([1.0, 1.0])
+
+    records = profile.records()
+
+    # slowest group first
+    assert [record["operations"] for record in records] == [[3], [1, 2]]
+    assert records[0]["seconds"] == 4.0
+    assert records[0]["mean_seconds"] == 2.0
+    assert records[0]["share"] == 4.0 / 6.0
+    assert records[1]["descriptions"] == [
+        "[a] Text transform on cells in column a", "[a] Create column b"]
+
+    report = profile.format_report().splitlines()
+    assert len(report) == 4
+    assert report[1].endswith("[c] Remove column c")
+
+def test_profile_apply():
+    server = standin.serve()
+    port = server.server_address[1]
+    server.state.projects["1"] = {"metadata": {}}
+
+    seconds = profiling.profile_apply(
+        "127.0.0.1", port, 0, project_id="1", or_project=OR_PROJECT, group_size=2)
+
+    assert len(seconds) == 2
+    assert server.state.requests["apply-operations"] == 2
+
+    server.shutdown()
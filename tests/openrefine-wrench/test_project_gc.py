@@ -0,0 +1,81 @@
+import pathlib
+import time
+from datetime import datetime, timezone
+from os import getpid
+from tempfile import TemporaryDirectory
+
+from context import openrefine_api_calls, project_gc, standin
+
+NOW = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+PROJECTS = {
+    "1": {
+        "name": "a_3f2b8c1e-5d4a-4b6c-9e8f-0a1b2c3d4e5f",
+        "created": "2024-01-01T00:00:00Z",
+        "tags": project_gc.project_tags("run_a")},
+    "2": {
+        "name": "b_3f2b8c1e-5d4a-4b6c-9e8f-0a1b2c3d4e5f",
+        "created": "2024-01-01T23:59:00Z",
+        "tags": project_gc.project_tags("run_b")},
+    "3": {
+        "name": "c_3f2b8c1e-5d4a-4b6c-9e8f-0a1b2c3d4e5f",
+        "created": "2023-12-01T00:00:00Z",
+        "tags": []},
+    "4": {
+        "name": "manual project",
+        "created": "2023-12-01T00:00:00Z",
+        "tags": []}}
+
+def test_select_projects():
+    # by age, only projects of openrefine-wrench runs
+    assert project_gc.select_projects(PROJECTS, max_age=3600, now=NOW) == ["1"]
+    assert project_gc.select_projects(
+        PROJECTS, max_age=3600, untagged=True, now=NOW) == ["1", "3"]
+
+    # by run, regardless of the age
+    assert project_gc.select_projects(
+        PROJECTS, max_age=3600, run_id="run_b", now=NOW) == ["1", "2"]
+    assert project_gc.select_projects(
+        PROJECTS, run_id="run_b", keep=[2], now=NOW) == []
+
+def test_select_standin_projects(monkeypatch):
+    # the stand-in stamps the creation time in utc, whatever the local time
+    monkeypatch.setenv("TZ", "UTC+5")
+    time.tzset()
+    server = standin.serve()
+
+    try:
+        with TemporaryDirectory() as work_dir:
+            pathlib.Path(f"{work_dir}/test.csv").write_text("a\n1\n", encoding="UTF-8")
+            openrefine_api_calls.create_or_project(
+                host="127.0.0.1",
+                port=server.server_address[1],
+                pid=getpid(),
+                project_file=f"{work_dir}/test.csv",
+                project_name="test_3f2b8c1e-5d4a-4b6c-9e8f-0a1b2c3d4e5f",
+                source_format="csv",
+                options={"projectTags": project_gc.project_tags("run_a")})
+
+        projects = openrefine_api_calls.get_or_projects_metadata(
+            host="127.0.0.1", port=server.server_address[1], pid=getpid())
+
+        assert len(projects) == 1
+        assert project_gc.select_projects(projects, max_age=600) == []
+    finally:
+        server.shutdown()
+        monkeypatch.undo()
+        time.tzset()
+
+def test_created():
+    wanted = datetime(2024, 1, 1, 10, 0, 0, 500000, tzinfo=timezone.utc)
+
+    for created in (
+        "2024-01-01T10:00:00.5Z",
+        "2024-01-01T10:00:00.500Z",
+        "2024-01-01T10:00:00.500000123Z",
+        "2024-01-01T12:00:00.5+02:00",
+        "2024-01-01T10:00:00.5"):
+        assert project_gc._created({"created": created}) == wanted
+
+    assert project_gc._created({"created": "yesterday"}) is None
+    assert project_gc._created({}) is None
@@ -0,0 +1,54 @@
+import gzip
+import json
+import pathlib
+import tempfile
+
+from context import openrefine_wrench, routing
+
+def test_router():
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = pathlib.Path(work_dir)
+        (work_dir / "feed_b").mkdir()
+        (work_dir / "feed_b" / "b.csv").write_text("a\n")
+        (work_dir / "feed_b" / "c.csv.gz").write_bytes(gzip.compress(b"a\n"))
+        (work_dir / "feed_b" / "d.xml").write_text("<a/>")
+        for name in ("a.json", "b.json", "default.json"):
+            (work_dir / name).write_text("[]")
+        (work_dir / "routes.json").write_text(json.dumps([
+            {"name": "a", "pattern": "feed_a_*.csv", "mappings_file": "a.json"},
+            {"source_dir": "feed_b", "mappings_file": "b.json", "options": {"separator": ";"}}]))
+
+        router = routing.Router(
+            work_dir / "routes.json", "csv", {"separator": ","}, work_dir / "default.json")
+
+        assert router.route("src/feed_a_1.csv")["name"] == "a"
+        assert router.route(work_dir / "feed_b" / "b.csv")["options"] == {"separator": ";"}
+        assert router.route("src/other.csv")["name"] == "default"
+        # compressed source files are routed as well
+        assert sorted(router.source_files()) == [
+            work_dir / "feed_b" / "b.csv", work_dir / "feed_b" / "c.csv.gz"]
+
+        # the mappings are the same, the options are not
+        assert router.hashes("src/feed_a_1.csv")[0] == router.hashes("src/other.csv")[0]
+        assert router.hashes("src/feed_a_1.csv")[1] != router.hashes(work_dir / "feed_b" / "b.csv")[1]
+
+        router = routing.Router(work_dir / "routes.json", "csv", {})
+        assert router.route("src/other.csv") is None
+
+def test_routes_with_the_same_name():
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = pathlib.Path(work_dir)
+        (work_dir / "a.json").write_text("[]")
+        (work_dir / "b.json").write_text('[{"op": "core/column-removal", "columnName": "a"}]')
+        (work_dir / "routes.json").write_text(json.dumps([
+            {"name": "x", "pattern": "a*", "mappings_file": "a.json"},
+            {"name": "x", "pattern": "b*", "mappings_file": "b.json"}]))
+
+        router = routing.Router(
+            work_dir / "routes.json", "csv", {}, mappings_file=work_dir / "a.json")
+        routed = openrefine_wrench._group_by_route(
+            ["a1.csv", "b1.csv", "c1.csv", "b2.csv"], router)
+
+        # each route keeps its own mappings, whatever its name
+        assert [(pathlib.Path(route["mappings_file"]).name, files) for route, files in routed] == [
+            ("a.json", ["a1.csv"]), ("b.json", ["b1.csv", "b2.csv"]), ("a.json", ["c1.csv"])]
@@ -0,0 +1,73 @@
+import pathlib
+import xml.etree.ElementTree as ET
+from tempfile import TemporaryDirectory
+
+from context import sharding
+
+csv_source = (
+    "first_name,last_name\n"
+    + "".join(f"Baked {num},Beans\n" for num in range(10))
+    + "Lovely,\"Spam\nand Spam\"\n"
+    + "".join(f"Wonderful {num},Spam\n" for num in range(10)))
+
+def test_non_row_local_operations():
+    or_project = [
+        {"op": "core/text-transform", "expression": "value.toUppercase()",
+         "description": "upper"},
+        {"op": "core/fill-down", "description": "fill down"},
+        {"op": "core/text-transform", "expression": "facetCount(value, 'value', 'x')",
+         "description": "count"},
+        {"op": "core/multivalued-cell-join", "columnName": "a", "keyColumnName": "id",
+         "separator": ",", "description": "join"},
+        {"op": "core/text-transform", "expression": "value.trim()",
+         "engineConfig": {"facets": [], "mode": "record-based"}, "description": "trim records"},
+        {"op": "core/text-transform", "expression": "value.trim()",
+         "engineConfig": {"facets": [], "mode": "row-based"}, "description": "trim rows"}]
+
+    assert sharding.non_row_local_operations(or_project) == [
+        "fill down", "count", "join", "trim records"]
+
+def test_shard_csv_and_merge_exports():
+    with TemporaryDirectory() as work_dir:
+        source_file = f"{work_dir}/test.csv"
+        pathlib.Path(source_file).write_text(csv_source, encoding="UTF-8")
+
+        shard_dir, shards = sharding.shard_file(
+            source_file, source_format="csv", shard_bytes=100, work_dir=work_dir)
+
+        assert len(shards) > 2
+        for shard in shards:
+            assert pathlib.Path(shard).read_text(encoding="UTF-8").startswith(
+                "first_name,last_name\n")
+
+        export_file = f"{work_dir}/test_export.csv"
+        sharding.merge_exports(shards, export_file)
+
+        assert pathlib.Path(export_file).read_text(encoding="UTF-8") == csv_source
+
+def test_shard_xml():
+    with TemporaryDirectory() as work_dir:
+        source_file = f"{work_dir}/test.xml"
+        pathlib.Path(source_file).write_text(
+            "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+            "<Records xmlns:x=\"http://example.org/x\">"
+            + "".join(f"<record><x:name>Spam {num}</x:name></record>" for num in range(10))
+            + "</Records>",
+            encoding="UTF-8")
+
+        shard_dir, shards = sharding.shard_file(
+            source_file,
+            source_format="xml",
+            shard_bytes=150,
+            work_dir=work_dir,
+            record_path=["Records", "record"])
+
+        records = []
+        for shard in shards:
+            root = ET.parse(shard).getroot()
+            assert root.tag == "Records"
+            records.extend(
+                record.find("{http://example.org/x}name").text for record in root)
+
+        assert len(shards) > 2
+        assert records == [f"Spam {num}" for num in range(10)]
@@ -0,0 +1,56 @@
+import gzip
+import os
+import pathlib
+import tempfile
+import stat
+import pytest
+
+from context import openrefine_api_calls, sink
+
+def _exports(work_dir):
+    exports = []
+    for num in range(3):
+        export_file = pathlib.Path(work_dir) / f"test_{num}.csv"
+        # the last row of an export may lack its line break
+        export_file.write_text(f"a,b\n{num},\"x\ny\"\n{num},z", encoding="UTF-8")
+        exports.append(str(export_file))
+    return exports
+
+def test_export_sink():
+    with tempfile.TemporaryDirectory() as work_dir:
+        exports = _exports(work_dir)
+
+        export_sink = sink.ExportSink(f"{work_dir}/out.csv", source_column="source")
+        for num, export_file in enumerate(exports):
+            export_sink.add(export_file, source_file=f"src/test_{num}.csv")
+        export_sink.close()
+
+        assert pathlib.Path(f"{work_dir}/out.csv").read_text(encoding="UTF-8") == (
+            "source,a,b\n" + "".join(
+                f"src/test_{num}.csv,{num},\"x\ny\"\nsrc/test_{num}.csv,{num},z\n"
+                for num in range(3)))
+        assert stat.S_IMODE(os.stat(f"{work_dir}/out.csv").st_mode) == (
+            openrefine_api_calls.FILE_MODE)
+
+        pathlib.Path(exports[0]).write_text("c\n1\n", encoding="UTF-8")
+        export_sink = sink.ExportSink(f"{work_dir}/out.csv")
+        export_sink.add(exports[1])
+        with pytest.raises(ValueError):
+            export_sink.add(exports[0])
+
+def test_export_sink_rolls_over():
+    with tempfile.TemporaryDirectory() as work_dir:
+        exports = _exports(work_dir)
+
+        export_sink = sink.ExportSink(f"{work_dir}/out.csv.gz", max_bytes=16)
+        for export_file in exports:
+            export_sink.add(export_file)
+        export_sink.close()
+
+        assert export_sink.output_files == [
+            f"{work_dir}/out.{num:05d}.csv.gz" for num in range(3)]
+        for num, output_file in enumerate(export_sink.output_files):
+            with gzip.open(output_file, mode="rt", encoding="UTF-8", newline="") as fi:
+                assert fi.read() == f"a,b\n{num},\"x\ny\"\n{num},z\n"
+        assert sorted(path.name for path in pathlib.Path(work_dir).glob("out*")) == [
+            f"out.{num:05d}.csv.gz" for num in range(3)]